@@ -0,0 +1,53 @@
+##
+# Benchmark comparing the conversion of scan results into per-BSS python
+# dictionaries against the columnar numpy export filled from the raw
+# attributes. The time for parsing the dump messages, which both need,
+# is reported separately.
+#
+# usage: python array_bench.py [count]
+#
+import sys
+import time
+
+import py80211.generated.defs as nl80211
+from py80211 import nlraw
+from py80211 import scan
+import synth
+
+def rows(data):
+	result = []
+	for m in nlraw.iter_msgs(data):
+		if m.type == nlraw.NLMSG_DONE:
+			break
+		result.append(nlraw.parse_attrs(m.attrs[nl80211.ATTR_BSS], len(scan.bss_policy)))
+	return result
+
+def to_dicts(data):
+	result = []
+	for nattrs in rows(data):
+		b = scan.bss(nattrs, scan.bss_policy)
+		result.append(dict([ (name, b.attrs.get(aid))
+				     for name, aid, coltype, size in scan.bss_columns ]))
+	return result
+
+def to_array(data):
+	return scan._raw_bss_array(rows(data))
+
+def bench(label, convert, data, count):
+	start = time.time()
+	for i in range(count):
+		convert(data)
+	elapsed = time.time() - start
+	print('%-6s: %8.3f ms/dump' % (label, 1000.0 * elapsed / count))
+	return elapsed
+
+if __name__ == '__main__':
+	count = 2000
+	if len(sys.argv) > 1:
+		count = int(sys.argv[1])
+	data = bytearray(synth.bss_dump(1, count))
+	print('synthetic scan dump: %d results' % count)
+	bench('parse', rows, data, 10)
+	t_dict = bench('dict', to_dicts, data, 10)
+	t_array = bench('array', to_array, data, 10)
+	print('speedup: %.2fx' % (t_dict / t_array))
@@ -0,0 +1,91 @@
+##
+# Compares decoding a recorded nl80211 dump using libnl against the
+# pure-python decoder in nlraw. Use record_dump.py to create the fixture.
+#
+# usage: python decode_bench.py {wiphy|interface|station|bss} <file> [count]
+#
+import sys
+import time
+import netlink.capi as nl
+import netlink.core as nlc
+import netlink.genl.capi as genl
+
+import py80211.generated.defs as nl80211
+from py80211 import base, nlraw
+from py80211.base import access80211
+from py80211.wiphy import wiphy
+from py80211.iface import interface
+from py80211.station import station
+from py80211.scan import bss, bss_policy
+
+access = access80211()
+
+def create_bss(attrs):
+	if nl80211.ATTR_BSS in attrs:
+		if isinstance(attrs, nlraw.raw_attrs):
+			nattrs = nlraw.parse_attrs(attrs[nl80211.ATTR_BSS], len(bss_policy))
+		else:
+			e, nattrs = nl.py_nla_parse_nested(len(bss_policy), attrs[nl80211.ATTR_BSS], bss_policy)
+		return bss(nattrs, bss_policy)
+
+decoders = {
+	'wiphy': lambda attrs: wiphy(access, attrs),
+	'interface': lambda attrs: interface(access, attrs),
+	'station': lambda attrs: station(0, None, access, attrs),
+	'bss': create_bss
+}
+
+##
+# Rebuilds a libnl message from the recorded message so the libnl path
+# decodes exactly the same attributes.
+def to_nlmsg(msg):
+	m = nlc.Message()
+	genl.genlmsg_put(m._msg, 0, 0, access.family, 0, 0, msg.cmd, 0)
+	start = nlraw.NLMSG_HDRLEN + nlraw.GENL_HDRLEN
+	for aid, data in nlraw.iter_attrs(msg.data, start):
+		nl.nla_put(m._msg, aid, bytearray(data))
+	return m
+
+##
+# Accesses all attributes recursively so lazily stored attributes are
+# decoded as well. Otherwise the raw path would only parse the messages.
+def materialize(obj):
+	if obj == None:
+		return
+	for val in obj.attrs.values():
+		if isinstance(val, base.nl80211_object):
+			materialize(val)
+		elif isinstance(val, list):
+			for item in val:
+				if isinstance(item, base.nl80211_object):
+					materialize(item)
+
+def run_libnl(decode, nlmsgs):
+	for m in nlmsgs:
+		e, attrs = genl.py_genlmsg_parse(nl.nlmsg_hdr(m._msg), 0, nl80211.ATTR_MAX, None)
+		materialize(decode(attrs))
+
+def run_raw(decode, data):
+	for m in nlraw.iter_msgs(bytearray(data)):
+		materialize(decode(m.attrs))
+
+def bench(label, func, args, count):
+	start = time.time()
+	for i in range(count):
+		func(*args)
+	elapsed = time.time() - start
+	print('%-6s: %8.3f ms/dump' % (label, 1000.0 * elapsed / count))
+	return elapsed
+
+kind = sys.argv[1]
+data = open(sys.argv[2], 'rb').read()
+count = 100
+if len(sys.argv) > 3:
+	count = int(sys.argv[3])
+
+msgs = list(nlraw.iter_msgs(bytearray(data)))
+nlmsgs = [ to_nlmsg(m) for m in msgs ]
+print('%s dump: %d messages, %d bytes' % (kind, len(msgs), len(data)))
+t_nl = bench('libnl', run_libnl, (decoders[kind], nlmsgs), count)
+t_raw = bench('raw', run_raw, (decoders[kind], data), count)
+print('speedup: %.2fx' % (t_nl / t_raw))
@@ -0,0 +1,46 @@
+##
+# Benchmark for the lazy attribute decoding. It decodes a synthetic
+# wiphy dump only accessing the wiphy name, which is what most callers
+# do, and again accessing all attributes recursively.
+#
+# usage: python lazy_bench.py [count]
+#
+import sys
+import time
+
+import py80211.generated.defs as nl80211
+from py80211 import nlraw
+from py80211.wiphy import wiphy
+from table_bench import materialize
+import synth
+
+def decode_name(data):
+	for m in nlraw.iter_msgs(data):
+		if m.type == nlraw.NLMSG_DONE:
+			break
+		wiphy(True, m.attrs).attrs[nl80211.ATTR_WIPHY_NAME]
+
+def decode_all(data):
+	for m in nlraw.iter_msgs(data):
+		if m.type == nlraw.NLMSG_DONE:
+			break
+		materialize(wiphy(True, m.attrs))
+
+def bench(label, decode, data, count):
+	start = time.time()
+	for i in range(count):
+		decode(data)
+	elapsed = time.time() - start
+	print('%-6s: %8.3f ms/dump' % (label, 1000.0 * elapsed / count))
+	return elapsed
+
+if __name__ == '__main__':
+	count = 20
+	if len(sys.argv) > 1:
+		count = int(sys.argv[1])
+
+	data = bytearray(synth.wiphy_dump(nphy=4))
+	print('synthetic wiphy dump: %d bytes' % len(data))
+	t_name = bench('name', decode_name, data, count)
+	t_all = bench('all', decode_all, data, count)
+	print('speedup: %.2fx' % (t_all / t_name))
@@ -0,0 +1,134 @@
+##
+# Memory benchmark comparing the slotted record classes against plain
+# nl80211_object instances for the nested leaf attributes. It decodes a
+# synthetic 3-band, 200-channel wiphy and a 1000-station dump and reports
+# the memory held by the resulting objects.
+#
+# The memory is measured using tracemalloc when available. Otherwise the
+# size of all objects reachable from the result is summed up using
+# sys.getsizeof().
+#
+# usage: python memory_bench.py [stations]
+#
+import sys
+import gc
+
+from py80211 import base, nlraw
+from py80211 import wiphy as wiphy_mod
+from py80211 import station as station_mod
+from table_bench import materialize
+import synth
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+##
+# Plain object classes replacing the record classes for comparison.
+class obj_freq(base.nl80211_object):
+	pass
+
+class obj_rate(base.nl80211_object):
+	pass
+
+class obj_bitrate(base.nl80211_object):
+	pass
+
+class obj_bss_param(base.nl80211_object):
+	pass
+
+def use_objects(enable):
+	band_map = wiphy_mod.wiphy_band.nest_attr_map
+	stats_map = station_mod.station_stats.nest_attr_map
+	if enable:
+		freq, rate = obj_freq, obj_rate
+		bitrate, bss_param = obj_bitrate, obj_bss_param
+	else:
+		freq, rate = wiphy_mod.wiphy_freq, wiphy_mod.wiphy_rate
+		bitrate, bss_param = station_mod.bitrate, station_mod.bss_param
+	for aid, cls in [ (wiphy_mod.nl80211.BAND_ATTR_FREQS, freq),
+			  (wiphy_mod.nl80211.BAND_ATTR_RATES, rate) ]:
+		band_map[aid] = (cls,) + band_map[aid][1:]
+	for aid, cls in [ (station_mod.nl80211.STA_INFO_TX_BITRATE, bitrate),
+			  (station_mod.nl80211.STA_INFO_RX_BITRATE, bitrate),
+			  (station_mod.nl80211.STA_INFO_BSS_PARAM, bss_param) ]:
+		stats_map[aid] = (cls,) + stats_map[aid][1:]
+
+##
+# Returns the size of all objects reachable from obj. Shared objects like
+# small integers, policies and classes are not counted.
+def deep_size(obj, seen=None):
+	if seen == None:
+		seen = set()
+	if id(obj) in seen or isinstance(obj, (type, bool)) or obj is None:
+		return 0
+	seen.add(id(obj))
+	size = sys.getsizeof(obj)
+	refs = []
+	if isinstance(obj, dict):
+		refs = obj.keys() + obj.values()
+	elif isinstance(obj, (list, tuple)):
+		refs = obj
+	elif isinstance(obj, base.lazy_attrs):
+		refs = [ obj._values, obj._raw ]
+	elif isinstance(obj, base.nl80211_record):
+		refs = obj.values()
+	elif hasattr(obj, '__dict__'):
+		refs = [ obj.__dict__[k] for k in obj.__dict__.keys()
+			 if not k in [ '_policy', '_table', '_access', '_proj' ] ]
+	for ref in refs:
+		size += deep_size(ref, seen)
+	return size
+
+def decode_wiphy():
+	data = bytearray(synth.wiphy_dump(nphy=1, nbands=3, nchan=200))
+	phys = []
+	for m in nlraw.iter_msgs(data):
+		if m.type == nlraw.NLMSG_DONE:
+			break
+		phy = wiphy_mod.wiphy(True, m.attrs)
+		materialize(phy)
+		phys.append(phy)
+	return phys
+
+def decode_stations(count):
+	data = bytearray(synth.station_dump(1, count))
+	stations = []
+	for m in nlraw.iter_msgs(data):
+		if m.type == nlraw.NLMSG_DONE:
+			break
+		sta = station_mod.station(1, None, True, m.attrs)
+		materialize(sta)
+		stations.append(sta)
+	return stations
+
+def measure(decode, *args):
+	gc.collect()
+	if tracemalloc != None:
+		tracemalloc.start()
+		result = decode(*args)
+		gc.collect()
+		size = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+	else:
+		result = decode(*args)
+		size = deep_size(result)
+	return size
+
+def bench(label, decode, *args):
+	use_objects(True)
+	s_obj = measure(decode, *args)
+	use_objects(False)
+	s_rec = measure(decode, *args)
+	print('%-10s: object %8d KiB, record %8d KiB (%.1f%% saved)' %
+	      (label, s_obj / 1024, s_rec / 1024, 100.0 * (s_obj - s_rec) / s_obj))
+
+if __name__ == '__main__':
+	count = 1000
+	if len(sys.argv) > 1:
+		count = int(sys.argv[1])
+	if tracemalloc == None:
+		print('tracemalloc not available: using sys.getsizeof()')
+	bench('wiphy', decode_wiphy)
+	bench('stations', decode_stations, count)
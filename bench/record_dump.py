@@ -0,0 +1,48 @@
+##
+# Records a nl80211 dump so it can be used as fixture by decode_bench.py.
+# The netlink messages are stored in the output file as received from
+# the kernel.
+#
+# usage: python record_dump.py {wiphy|interface|station|bss} <file> [ifname]
+#
+import sys
+import netlink.capi as nl
+import netlink.core as nlc
+
+import py80211.generated.defs as nl80211
+from py80211.base import access80211, custom_handler
+
+dump_cmds = {
+	'wiphy': nl80211.CMD_GET_WIPHY,
+	'interface': nl80211.CMD_GET_INTERFACE,
+	'station': nl80211.CMD_GET_STATION,
+	'bss': nl80211.CMD_GET_SCAN
+}
+
+class recorder(custom_handler):
+	def __init__(self):
+		self.data = bytearray()
+		self.count = 0
+
+	def handle(self, msg, arg):
+		return nl.NL_SKIP
+
+	def handle_raw(self, msg):
+		self.data += msg.data.tobytes()
+		# keep the messages aligned as they are in the receive buffer
+		self.data += '\0' * (-len(self.data) & 3)
+		self.count += 1
+
+kind = sys.argv[1]
+a = access80211(raw=True)
+flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
+m = a.alloc_genlmsg(dump_cmds[kind], flags)
+if len(sys.argv) > 3:
+	nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, nl.if_nametoindex(sys.argv[3]))
+rec = recorder()
+err = a.send(m, rec)
+if err < 0:
+	print('dump failed: %d' % err)
+	sys.exit(1)
+open(sys.argv[2], 'wb').write(rec.data)
+print('recorded %d messages (%d bytes)' % (rec.count, len(rec.data)))
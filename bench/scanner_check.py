@@ -0,0 +1,79 @@
+##
+# Constructs a rolling_scanner on synthetic interface, wiphy and scan
+# dumps and checks the channels, the cached scan results and the channel
+# groups it picks. The dumps are served by a fake access instead of the
+# kernel and no scan is triggered, so no wireless device is needed.
+#
+# usage: python scanner_check.py [bss count]
+#
+import sys
+
+import netlink.capi as nl
+import netlink.core as nlc
+import netlink.genl.capi as genl
+
+import py80211.generated.defs as nl80211
+from py80211 import nlraw
+from py80211.scanner import rolling_scanner
+import synth
+
+IFIDX = 1
+NBANDS = 2
+NCHAN = 13
+
+##
+# Access returning the synthetic dump for the command of the message
+# instead of sending it to the kernel.
+class synth_access(object):
+	def __init__(self, dumps):
+		self._dumps = dumps
+		self.family = synth.NL80211_FAMILY
+
+	def alloc_genlmsg(self, cmd, flags=0):
+		msg = nlc.Message()
+		genl.genlmsg_put(msg._msg, 0, 0, self.family, 0, flags, cmd, 0)
+		return msg
+
+	def genlmsg_template(self, cmd, flags, key, put):
+		msg = self.alloc_genlmsg(cmd, flags)
+		put(msg)
+		return msg
+
+	def dump_raw(self, msg, timeout=None):
+		cmd = genl.genlmsg_hdr(nl.nlmsg_hdr(msg._msg)).cmd
+		for m in nlraw.iter_msgs(bytearray(self._dumps[cmd])):
+			if m.type != nlraw.NLMSG_DONE:
+				yield m
+
+	def send(self, msg, handler, timeout=None):
+		for m in self.dump_raw(msg, timeout):
+			handler.handle_raw(m)
+		return 0
+
+def check(label, ok):
+	print('%-40s %s' % (label, 'ok' if ok else 'FAILED'))
+	return ok
+
+nbss = 40
+if len(sys.argv) > 1:
+	nbss = int(sys.argv[1])
+
+access = synth_access({
+	nl80211.CMD_GET_INTERFACE: synth.iface_dump(2),
+	nl80211.CMD_GET_WIPHY: synth.wiphy_split_dump(2, NBANDS, NCHAN, 5),
+	nl80211.CMD_GET_SCAN: synth.bss_dump(IFIDX, nbss)
+})
+rs = rolling_scanner(IFIDX, group_size=3, access=access)
+
+expected = [ 2412 + 5 * (c + 200 * b) for b in range(NBANDS) for c in range(NCHAN) ]
+occupancy = rs.occupancy()
+group = rs.next_group()
+results = [
+	check('channels of the wiphy', sorted(occupancy.keys()) == expected),
+	check('scan results cached', len(rs.bss) == nbss),
+	check('all results counted per channel', sum(occupancy.values()) == nbss),
+	check('group size', len(group) == 3 and set(group) <= set(expected)),
+	check('no channel scanned yet', all([ age == None for age in rs.ages().values() ]))
+]
+if not all(results):
+	sys.exit(1)
@@ -0,0 +1,55 @@
+##
+# Benchmark for storing a station dump in station_list using the index
+# keyed by MAC address against the previous linear search. The dump
+# time of the index should scale linearly with the number of stations.
+#
+# usage: python station_bench.py [count]
+#
+import sys
+import time
+from collections import OrderedDict
+
+from py80211 import nlraw
+from py80211.station import station, station_list
+import synth
+
+##
+# Reference implementation scanning the list for every station.
+class linear_station_list(station_list):
+	def __iter__(self):
+		return iter(self._station)
+
+	def store_station(self, sta):
+		for s in self._station:
+			if s == sta:
+				s._attrs = sta._attrs
+				return
+		self._station.append(sta)
+
+def dump(sl, msgs):
+	for m in msgs:
+		sl.handle_raw(m)
+
+def bench(cls, stations, msgs, count):
+	start = time.time()
+	for i in range(count):
+		sl = cls.__new__(cls)
+		sl._station = stations()
+		sl._ifidx = 1
+		sl._proj = None
+		sl._access = True
+		sl._seen = None
+		dump(sl, msgs)
+	return (time.time() - start) / count
+
+count = 3
+if len(sys.argv) > 1:
+	count = int(sys.argv[1])
+
+print('%8s %12s %12s' % ('stations', 'index', 'linear'))
+for nsta in [ 250, 500, 1000, 2000 ]:
+	data = bytearray(synth.station_dump(1, nsta))
+	msgs = [ m for m in nlraw.iter_msgs(data) if m.type != nlraw.NLMSG_DONE ]
+	t_index = bench(station_list, OrderedDict, msgs, count)
+	t_linear = bench(linear_station_list, list, msgs, count)
+	print('%8d %9.1f ms %9.1f ms' % (nsta, 1000 * t_index, 1000 * t_linear))
@@ -0,0 +1,195 @@
+##
+# Helpers creating synthetic nl80211 dumps in the format received from
+# the kernel. These are used by the benchmarks that do not need a recorded
+# fixture.
+#
+import struct
+
+import py80211.generated.defs as nl80211
+
+NL80211_FAMILY = 0x1c
+
+def nla(aid, payload, nested=False):
+	size = 4 + len(payload)
+	if nested:
+		aid |= 1 << 15
+	return struct.pack('=HH', size, aid) + payload + '\0' * (-size & 3)
+
+def nla_u8(aid, val):
+	return nla(aid, struct.pack('=B', val))
+
+def nla_u16(aid, val):
+	return nla(aid, struct.pack('=H', val))
+
+def nla_u32(aid, val):
+	return nla(aid, struct.pack('=I', val & 0xffffffff))
+
+def nla_u64(aid, val):
+	return nla(aid, struct.pack('=Q', val))
+
+def nla_flag(aid):
+	return nla(aid, '')
+
+def nla_string(aid, val):
+	return nla(aid, val + '\0')
+
+def nla_nest(aid, items):
+	return nla(aid, ''.join(items), True)
+
+def genlmsg(cmd, payload, seq=1, flags=2):
+	body = struct.pack('=BBH', cmd, 1, 0) + payload
+	size = 16 + len(body)
+	return struct.pack('=IHHII', size, NL80211_FAMILY, flags, seq, 0) + body + '\0' * (-size & 3)
+
+def done(seq=1):
+	return struct.pack('=IHHIIi', 20, 3, 2, seq, 0, 0)
+
+def mac_addr(idx):
+	return struct.pack('>HI', 0x0200, idx)
+
+def freq_nest(b, c):
+	freq = [ nla_u32(nl80211.FREQUENCY_ATTR_FREQ, 2412 + 5 * (c + 200 * b)),
+		 nla_u32(nl80211.FREQUENCY_ATTR_MAX_TX_POWER, 2000) ]
+	if c % 4 == 3:
+		freq.append(nla_flag(nl80211.FREQUENCY_ATTR_NO_IR))
+		freq.append(nla_flag(nl80211.FREQUENCY_ATTR_RADAR))
+		freq.append(nla_u32(nl80211.FREQUENCY_ATTR_DFS_STATE, 0))
+	return nla_nest(c, freq)
+
+def rates_nest():
+	rates = []
+	for r in [ 60, 90, 120, 180, 240, 360, 480, 540 ]:
+		rates.append(nla_nest(len(rates), [ nla_u32(nl80211.BITRATE_ATTR_RATE, r) ]))
+	return nla_nest(nl80211.BAND_ATTR_RATES, rates)
+
+def band_info():
+	return [ nla_u16(nl80211.BAND_ATTR_HT_CAPA, 0x19ef),
+		 nla_u8(nl80211.BAND_ATTR_HT_AMPDU_FACTOR, 3),
+		 nla(nl80211.BAND_ATTR_HT_MCS_SET, '\xff\xff' + 14 * '\0') ]
+
+def wiphy_hdr(phynum):
+	return [ nla_u32(nl80211.ATTR_WIPHY, phynum),
+		 nla_string(nl80211.ATTR_WIPHY_NAME, 'phy%d' % phynum),
+		 nla_u32(nl80211.ATTR_GENERATION, 1) ]
+
+def commands_nest(first, last):
+	return nla_nest(nl80211.ATTR_SUPPORTED_COMMANDS,
+			[ nla_u32(i, c) for i, c in enumerate(range(first, last)) ])
+
+def cipher_suites():
+	return nla(nl80211.ATTR_CIPHER_SUITES, struct.pack('=4I', 0x000fac01, 0x000fac05, 0x000fac02, 0x000fac04))
+
+##
+# Creates a wiphy message with nbands bands each having nchan channels.
+def wiphy_msg(phynum, nbands=3, nchan=200):
+	bands = []
+	for b in range(nbands):
+		freqs = [ freq_nest(b, c) for c in range(nchan) ]
+		band = [ nla_nest(nl80211.BAND_ATTR_FREQS, freqs), rates_nest() ] + band_info()
+		bands.append(nla_nest(b, band))
+	attrs = wiphy_hdr(phynum) + [ nla_nest(nl80211.ATTR_WIPHY_BANDS, bands),
+				      commands_nest(1, 60), cipher_suites() ]
+	return genlmsg(nl80211.CMD_NEW_WIPHY, ''.join(attrs))
+
+##
+# Creates the messages of a split wiphy dump with the same content as
+# wiphy_msg(). Like the kernel each message holds a part of a band with
+# at most chunk channels and the supported commands are split as well.
+def wiphy_split_msgs(phynum, nbands=3, nchan=200, chunk=50):
+	msgs = [ wiphy_hdr(phynum) + [ cipher_suites() ] ]
+	for b in range(nbands):
+		msgs.append(wiphy_hdr(phynum) + [ nla_nest(nl80211.ATTR_WIPHY_BANDS,
+				[ nla_nest(b, band_info() + [ rates_nest() ]) ]) ])
+		for start in range(0, nchan, chunk):
+			freqs = [ freq_nest(b, c) for c in range(start, min(nchan, start + chunk)) ]
+			msgs.append(wiphy_hdr(phynum) + [ nla_nest(nl80211.ATTR_WIPHY_BANDS,
+					[ nla_nest(b, [ nla_nest(nl80211.BAND_ATTR_FREQS, freqs) ]) ]) ])
+	msgs.append(wiphy_hdr(phynum) + [ commands_nest(1, 30) ])
+	msgs.append(wiphy_hdr(phynum) + [ commands_nest(30, 60) ])
+	return [ genlmsg(nl80211.CMD_NEW_WIPHY, ''.join(attrs)) for attrs in msgs ]
+
+def wiphy_dump(nphy=1, nbands=3, nchan=200):
+	return ''.join([ wiphy_msg(p, nbands, nchan) for p in range(nphy) ]) + done()
+
+def bitrate_nest(aid, rate, mcs):
+	return nla_nest(aid, [ nla_u16(nl80211.RATE_INFO_BITRATE, rate),
+			       nla_u32(nl80211.RATE_INFO_BITRATE32, rate),
+			       nla_u8(nl80211.RATE_INFO_MCS, mcs),
+			       nla_flag(nl80211.RATE_INFO_SHORT_GI) ])
+
+##
+# Creates a station message for the given station index.
+def station_msg(ifidx, idx):
+	info = [ nla_u32(nl80211.STA_INFO_INACTIVE_TIME, 10 * idx),
+		 nla_u32(nl80211.STA_INFO_RX_BYTES, 1000 * idx),
+		 nla_u32(nl80211.STA_INFO_TX_BYTES, 2000 * idx),
+		 nla_u64(nl80211.STA_INFO_RX_BYTES64, 1000 * idx),
+		 nla_u64(nl80211.STA_INFO_TX_BYTES64, 2000 * idx),
+		 nla_u32(nl80211.STA_INFO_RX_PACKETS, idx),
+		 nla_u32(nl80211.STA_INFO_TX_PACKETS, idx),
+		 nla_u32(nl80211.STA_INFO_TX_RETRIES, idx % 7),
+		 nla_u32(nl80211.STA_INFO_TX_FAILED, idx % 3),
+		 nla_u8(nl80211.STA_INFO_SIGNAL, 256 - 40 - idx % 50),
+		 nla_u8(nl80211.STA_INFO_SIGNAL_AVG, 256 - 42 - idx % 50),
+		 nla_nest(nl80211.STA_INFO_CHAIN_SIGNAL, [ nla_u8(0, 200), nla_u8(1, 202) ]),
+		 bitrate_nest(nl80211.STA_INFO_TX_BITRATE, 650, 7),
+		 bitrate_nest(nl80211.STA_INFO_RX_BITRATE, 585, 6),
+		 nla_u32(nl80211.STA_INFO_CONNECTED_TIME, idx),
+		 nla(nl80211.STA_INFO_STA_FLAGS, struct.pack('=ii', 0x7e, 0x22)),
+		 nla_nest(nl80211.STA_INFO_BSS_PARAM, [ nla_u8(nl80211.STA_BSS_PARAM_DTIM_PERIOD, 1),
+							nla_u16(nl80211.STA_BSS_PARAM_BEACON_INTERVAL, 100) ]) ]
+	attrs = [ nla_u32(nl80211.ATTR_IFINDEX, ifidx),
+		  nla(nl80211.ATTR_MAC, mac_addr(idx)),
+		  nla_u32(nl80211.ATTR_GENERATION, 1),
+		  nla_nest(nl80211.ATTR_STA_INFO, info) ]
+	return genlmsg(nl80211.CMD_NEW_STATION, ''.join(attrs))
+
+def station_dump(ifidx, count):
+	return ''.join([ station_msg(ifidx, i) for i in range(count) ]) + done()
+
+##
+# Creates a scan result message for the given BSS index.
+def bss_msg(ifidx, idx, ies_len=300):
+	ssid = 'net-%d' % idx
+	ies = struct.pack('=BB', 0, len(ssid)) + ssid
+	ies += struct.pack('=BB', 7, 6) + 'NL\x20\x01\x0d\x14'
+	while len(ies) < ies_len:
+		ies += struct.pack('=BB', 221, 24) + '\x00\x50\xf2\x02' + 20 * '\x11'
+	info = [ nla(nl80211.BSS_BSSID, mac_addr(idx)),
+		 nla_u32(nl80211.BSS_FREQUENCY, 2412 + 5 * (idx % 13)),
+		 nla_u64(nl80211.BSS_TSF, 1000000 * idx),
+		 nla_u16(nl80211.BSS_BEACON_INTERVAL, 100),
+		 nla_u16(nl80211.BSS_CAPABILITY, 0x431),
+		 nla(nl80211.BSS_INFORMATION_ELEMENTS, ies),
+		 nla_u32(nl80211.BSS_SIGNAL_MBM, -4000 - 10 * (idx % 50)),
+		 nla_u32(nl80211.BSS_SEEN_MS_AGO, idx % 1000),
+		 nla(nl80211.BSS_BEACON_IES, ies),
+		 nla_u32(nl80211.BSS_CHAN_WIDTH, 0) ]
+	attrs = [ nla_u32(nl80211.ATTR_GENERATION, 1),
+		  nla_u32(nl80211.ATTR_IFINDEX, ifidx),
+		  nla_nest(nl80211.ATTR_BSS, info) ]
+	return genlmsg(nl80211.CMD_NEW_SCAN_RESULTS, ''.join(attrs))
+
+def bss_dump(ifidx, count, ies_len=300):
+	return ''.join([ bss_msg(ifidx, i, ies_len) for i in range(count) ]) + done()
+
+##
+# Creates an interface message for the given interface on the given wiphy.
+def iface_msg(ifidx, phynum):
+	attrs = [ nla_u32(nl80211.ATTR_IFINDEX, ifidx),
+		  nla_string(nl80211.ATTR_IFNAME, 'wlan%d' % ifidx),
+		  nla_u32(nl80211.ATTR_WIPHY, phynum),
+		  nla_u64(nl80211.ATTR_WDEV, (phynum << 32) | 1),
+		  nla_u32(nl80211.ATTR_IFTYPE, nl80211.IFTYPE_STATION),
+		  nla(nl80211.ATTR_MAC, mac_addr(0x1000 + ifidx)),
+		  nla_u32(nl80211.ATTR_GENERATION, 1) ]
+	return genlmsg(nl80211.CMD_NEW_INTERFACE, ''.join(attrs))
+
+def iface_dump(count):
+	return ''.join([ iface_msg(i, i) for i in range(count) ]) + done()
+
+def wiphy_split_dump(nphy=1, nbands=3, nchan=200, chunk=50):
+	msgs = []
+	for p in range(nphy):
+		msgs += wiphy_split_msgs(p, nbands, nchan, chunk)
+	return ''.join(msgs) + done()
@@ -0,0 +1,129 @@
+##
+# Micro-benchmark comparing the compiled policy decode tables against
+# the if/elif ladder over the policy type which was used before. It
+# decodes a large synthetic wiphy dump using both.
+#
+# usage: python table_bench.py [count]
+#
+import sys
+import time
+import netlink.capi as nl
+
+import py80211.generated.defs as nl80211
+from py80211 import base, nlraw
+from py80211.wiphy import wiphy
+import synth
+
+##
+# Reference implementation using the if/elif ladder for each attribute.
+def ladder_store_raw_attrs(self, attrs):
+	for aid in attrs.keys():
+		data = attrs[aid]
+		try:
+			pol = self._policy[aid]
+			if pol.type in base.raw_getters:
+				self._attrs[aid] = base.raw_getters[pol.type](data)
+			elif pol.type == nl.NLA_FLAG:
+				self._attrs[aid] = True
+			elif pol.type == nl.NLA_NESTED:
+				if hasattr(pol, 'single') and pol.single:
+					obj = self.create_nested_raw(data, aid, aid)
+				elif hasattr(pol, 'map') and pol.map:
+					obj = ladder_create_map(data, pol)
+				elif hasattr(pol, 'list_type'):
+					obj = ladder_create_list(data, pol)
+				else:
+					obj = self.create_nested_list_raw(data, aid)
+				self._attrs[aid] = obj
+			elif pol.type in [ base.NLA_BINARY, nl.NLA_UNSPEC ]:
+				self._attrs[aid] = nlraw.get_data(data)
+			if hasattr(pol, 'signed') and pol.signed:
+				self._attrs[aid] = ladder_convert_sign(self._attrs[aid], pol)
+		except Exception as e:
+			self._attrs[aid] = nlraw.get_data(data)
+	self.post_store_attrs(attrs)
+
+def ladder_convert_sign(attr, pol):
+	conv_tab = {
+		nl.NLA_U32: 0x80000000,
+		nl.NLA_U16: 0x8000,
+		nl.NLA_U8: 0x80
+	}
+	pol_type = pol.type
+	if pol.type == nl.NLA_NESTED:
+		pol_type = pol.list_type
+	if not pol_type in conv_tab:
+		raise Exception("invalid type (%d) for sign conversion" % pol_type)
+	conv_check = conv_tab[pol_type]
+	if pol.type != nl.NLA_NESTED:
+		if attr & conv_check:
+			return -conv_check + (attr & (conv_check - 1))
+	else:
+		for aid in range(len(attr)):
+			attr[aid] = -conv_check + (attr[aid] & (conv_check - 1))
+	return attr
+
+def ladder_create_list(data, pol):
+	nest_list = []
+	item_type = pol.list_type
+	for t, item in nlraw.iter_attrs(data):
+		if item_type == base.NLA_NUL_STRING:
+			nest_obj = nlraw.get_string(item)
+		elif item_type == nl.NLA_U64:
+			nest_obj = nlraw.get_u64(item)
+		elif item_type == nl.NLA_U32:
+			nest_obj = nlraw.get_u32(item)
+		elif item_type == nl.NLA_U16:
+			nest_obj = nlraw.get_u16(item)
+		elif item_type == nl.NLA_U8:
+			nest_obj = nlraw.get_u8(item)
+		nest_list.append(nest_obj)
+	return nest_list
+
+def ladder_create_map(data, pol):
+	nest_map = {}
+	for key, item in nlraw.iter_attrs(data):
+		nest_list = ladder_create_list(item, pol)
+		if len(nest_list) > 0:
+			nest_map[key] = nest_list
+	return nest_map
+
+##
+# Accesses all attributes recursively so lazily stored attributes are
+# decoded as well.
+def materialize(obj):
+	for val in obj.attrs.values():
+		if isinstance(val, base.nl80211_object):
+			materialize(val)
+		elif isinstance(val, list):
+			for item in val:
+				if isinstance(item, base.nl80211_object):
+					materialize(item)
+
+def decode(data):
+	for m in nlraw.iter_msgs(data):
+		if m.type == nlraw.NLMSG_DONE:
+			break
+		materialize(wiphy(True, m.attrs))
+
+def bench(label, data, count):
+	start = time.time()
+	for i in range(count):
+		decode(data)
+	elapsed = time.time() - start
+	print('%-6s: %8.3f ms/dump' % (label, 1000.0 * elapsed / count))
+	return elapsed
+
+if __name__ == '__main__':
+	count = 20
+	if len(sys.argv) > 1:
+		count = int(sys.argv[1])
+
+	data = bytearray(synth.wiphy_dump(nphy=4))
+	print('synthetic wiphy dump: %d bytes' % len(data))
+	t_table = bench('table', data, count)
+	table_store = base.nl80211_object.store_raw_attrs
+	base.nl80211_object.store_raw_attrs = ladder_store_raw_attrs
+	t_ladder = bench('ladder', data, count)
+	base.nl80211_object.store_raw_attrs = table_store
+	print('speedup: %.2fx' % (t_ladder / t_table))
@@ -0,0 +1,16 @@
+from py80211.mux import access80211_mux
+from py80211.station import *
+import netlink.capi as nl
+import sys
+
+# dump the stations of all given interfaces with the requests in flight
+# at the same time over a single socket.
+mux = access80211_mux()
+sls = {}
+for ifname in sys.argv[1:]:
+	sls[ifname] = station_list(nl.if_nametoindex(ifname), mux)
+mux.wait()
+for ifname in sls.keys():
+	print '%s:' % ifname
+	for sta in sls[ifname]:
+		print sta.attrs[nl80211.ATTR_STA_INFO].attrs
@@ -0,0 +1,23 @@
+from py80211.pool import access80211_pool
+from py80211.station import *
+import netlink.capi as nl
+import threading
+import sys
+
+# dump the stations of all given interfaces in parallel threads sharing
+# a pool of nl80211 connections.
+pool = access80211_pool(len(sys.argv) - 1)
+sls = {}
+
+def poll(ifname):
+	sls[ifname] = station_list(nl.if_nametoindex(ifname), pool)
+
+threads = [ threading.Thread(target=poll, args=(ifname,)) for ifname in sys.argv[1:] ]
+for t in threads:
+	t.start()
+for t in threads:
+	t.join()
+for ifname in sls.keys():
+	print '%s:' % ifname
+	for sta in sls[ifname]:
+		print sta.attrs[nl80211.ATTR_STA_INFO].attrs
@@ -0,0 +1,19 @@
+from py80211.monitor import *
+import netlink.capi as nl
+import sys
+
+# print station associations and disassociations as they happen instead
+# of polling the station list.
+def station_event(evt):
+	mac = ':'.join([ '%02x' % b for b in evt.attrs[nl80211.ATTR_MAC] ])
+	if evt.cmd == nl80211.CMD_NEW_STATION:
+		print 'ifindex %d: %s associated' % (evt.ifindex, mac)
+	else:
+		print 'ifindex %d: %s disassociated' % (evt.ifindex, mac)
+
+mon = monitor()
+mon.add_callback(station_event, [ nl80211.CMD_NEW_STATION, nl80211.CMD_DEL_STATION ])
+try:
+	mon.run()
+except KeyboardInterrupt:
+	mon.close()
@@ -0,0 +1,12 @@
+from py80211.poller import *
+
+# poll the stations and scan results of all interfaces in parallel and
+# report how long each interface took.
+p = interface_poller(workers=4)
+snap = p.poll(timeout=5.0)
+for ifname, latency in snap.latency().items():
+	if latency == None:
+		print '%s: timed out' % ifname
+	else:
+		print '%s: %.1f ms' % (ifname, 1000.0 * latency)
+print '%d stations, %d scan results in %.1f ms' % (len(snap.stations()), len(snap.bss()), 1000.0 * snap.duration)
@@ -0,0 +1,19 @@
+from py80211.iface import interface_list
+from py80211.scan import multi_scan
+import py80211.generated.defs as nl80211
+
+# scan on all interfaces in parallel and report the results of each
+# interface as soon as they are available.
+ifindexes = []
+for iface in interface_list():
+	if nl80211.ATTR_IFINDEX in iface.attrs:
+		ifindexes.append(iface.attrs[nl80211.ATTR_IFINDEX])
+ms = multi_scan(ifindexes, only=[ nl80211.BSS_BSSID, nl80211.BSS_FREQUENCY, nl80211.BSS_SIGNAL_MBM ])
+for res in ms.results(timeout=10.0):
+	if res.error != None:
+		print 'ifindex %d: failed (%s)' % (res.ifidx, res.error)
+		continue
+	print 'ifindex %d: %d BSS after %.1f s' % (res.ifidx, len(res.bss), res.latency)
+	for b in res.bss:
+		print '  %s %d MHz %.1f dBm' % (str(b.attrs[nl80211.BSS_BSSID]).encode('hex'),
+			b.attrs[nl80211.BSS_FREQUENCY], b.attrs[nl80211.BSS_SIGNAL_MBM] / 100.0)
@@ -0,0 +1,17 @@
+import sys
+import time
+
+from py80211.scanner import rolling_scanner
+
+# background scan on the given interface scanning three channels at a
+# time and report the changes in the scan results after each step.
+ifidx = int(sys.argv[1])
+rs = rolling_scanner(ifidx, group_size=3)
+for i in range(20):
+	group = rs.step()
+	if isinstance(group, list):
+		print 'scanned %s: %d BSS, %d added, %d changed, %d removed' % (group, len(rs.bss),
+			len(rs.bss.added), len(rs.bss.changed), len(rs.bss.removed))
+	else:
+		print 'scan failed (%d)' % group
+	time.sleep(2.0)
@@ -0,0 +1,22 @@
+import sys
+
+from py80211.scan import sched_scan_start, sched_scan_stop, sched_scan_results
+import py80211.generated.defs as nl80211
+
+# offload scanning for the given SSID to the device: scan every 10 seconds
+# for the first 6 scans and every 60 seconds after that, only reporting
+# networks with a signal of at least -75 dBm.
+ifidx = int(sys.argv[1])
+ssid = sys.argv[2]
+res = sched_scan_results(ifidx)
+ss = sched_scan_start(ifidx)
+ss.add_matches([ { 'ssid': ssid, 'rssi': -75 } ])
+ss.set_plans([ (10, 6), (60, None) ])
+ss.send(timeout=5.0)
+try:
+	for b in res.results(timeout=300.0):
+		print '%s %d MHz %.1f dBm' % (str(b.attrs[nl80211.BSS_BSSID]).encode('hex'),
+			b.attrs[nl80211.BSS_FREQUENCY], b.attrs[nl80211.BSS_SIGNAL_MBM] / 100.0)
+finally:
+	sched_scan_stop(ifidx).send(timeout=5.0)
+	res.close()
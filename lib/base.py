@@ -17,8 +17,15 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 import sys
+import os
 import traceback
+import socket
+import select
+import errno
+import fcntl
+import time
 from abc import *
+from collections import MutableMapping, OrderedDict
 
 import netlink.capi as nl
 import netlink.genl.capi as genl
@@ -27,16 +34,74 @@ import netlink.core as nlc
 import generated.defs as nl80211
 from generated import strmap
 import factory
+import nlraw
+import ctrl
 
 NLA_NUL_STRING = nl.NLA_NESTED + 2
 NLA_BINARY = nl.NLA_NESTED + 3
 
+NL_RECV_SIZE = 65536
+
+##
+# Maximum time in seconds a wait for a response blocks before checking
+# whether it was cancelled.
+ACCESS_POLL_INTERVAL = 0.2
+
+##
+# Maximum number of message templates kept by access80211.
+ACCESS_MAX_TEMPLATES = 256
+
+##
+# Sequence number value for which libnl assigns the next sequence number
+# of the socket when sending the message.
+NL_AUTO_SEQ = 0
+
+##
+# Error value returned by libnl when a non-blocking socket has no more
+# data.
+NLE_AGAIN = 4
+
+##
+# Functions decoding the basic attribute types from the libnl attribute.
+nla_getters = {
+	NLA_NUL_STRING: nl.nla_get_string,
+	nl.NLA_U64: nl.nla_get_u64,
+	nl.NLA_U32: nl.nla_get_u32,
+	nl.NLA_U16: nl.nla_get_u16,
+	nl.NLA_U8: nl.nla_get_u8
+}
+
+##
+# Functions decoding the basic attribute types from the payload in the
+# raw buffer.
+raw_getters = {
+	NLA_NUL_STRING: nlraw.get_string,
+	nl.NLA_U64: nlraw.get_u64,
+	nl.NLA_U32: nlraw.get_u32,
+	nl.NLA_U16: nlraw.get_u16,
+	nl.NLA_U8: nlraw.get_u8
+}
+
 ##
 # Exception which is raised when netlink socket is already
 # doing a transaction.
 class AccessBusyError(Exception):
 	pass
 
+##
+# Exception which is raised when the response is not received within the
+# timeout.
+class AccessTimeoutError(Exception):
+	def __init__(self, timeout):
+		Exception.__init__(self, "no response within %.3f seconds" % timeout)
+		self.timeout = timeout
+
+##
+# Exception which is raised when waiting for the response is cancelled
+# using access80211.cancel().
+class AccessCancelledError(Exception):
+	pass
+
 ##
 # Abstract class specifying the interface for object class which
 # can be used to provide a custom netlink callback function.
@@ -47,23 +112,80 @@ class custom_handler(object):
 	def handle(self, msg, arg):
 		pass
 
+	##
+	# Handler called by access80211.send_raw() for each valid message. The
+	# provided message is a nlraw.genl_msg instance. By default the message
+	# is rebuilt as libnl message and passed to handle() so any handler can
+	# be used with a raw access. Handlers override this to parse the
+	# message in python instead.
+	def handle_raw(self, msg):
+		m = raw_to_nlmsg(msg)
+		return self.handle(m._msg, None)
+
+##
+# Creates a libnl message holding the same header and attributes as the
+# given nlraw.genl_msg instance.
+def raw_to_nlmsg(msg):
+	m = nlc.Message()
+	genl.genlmsg_put(m._msg, msg.pid, msg.seq, msg.type, 0, msg.flags, msg.cmd, msg.version)
+	start = nlraw.NLMSG_HDRLEN + nlraw.GENL_HDRLEN
+	for aid, data in nlraw.iter_attrs(msg.data, start):
+		nl.nla_put(m._msg, aid, bytearray(data))
+	return m
+
 ##
 # This class provides socket connection to the nl80211 genl family.
 class access80211(object):
 	""" provide access to the nl80211 API """
-	def __init__(self, level=nl.NL_CB_DEFAULT):
+	def __init__(self, level=nl.NL_CB_DEFAULT, raw=False, family=None, timeout=None):
 		self._tx_cb = nlc.Callback(level)
 		self._rx_cb = nlc.Callback(level)
-		self._sock = nlc.Socket(self._tx_cb)
+		self._sock = self._connect()
 
 		self._rx_cb.set_err(nl.NL_CB_CUSTOM, self.error_handler, None)
 		self._rx_cb.set_type(nl.NL_CB_FINISH, nl.NL_CB_CUSTOM, self.finish_handler, None)
 		self._rx_cb.set_type(nl.NL_CB_ACK, nl.NL_CB_CUSTOM, self.ack_handler, None)
 
-		self._sock.connect(nlc.NETLINK_GENERIC)
-		self._family = genl.genl_ctrl_resolve(self._sock._sock, 'nl80211')
+		if family == None:
+			family = ctrl.resolve('nl80211')
+		self._family = family
+		self._raw = raw
+		self._rawnl = None
+		self._rawsock = None
+		self._timeout = timeout
+		self._cancelled = False
+		self._poller = None
+		self._rawpoller = None
+		self._templates = OrderedDict()
 		self.busy = 0
 
+	##
+	# Creates a new libnl socket connected to generic netlink. The socket
+	# is non-blocking so receiving a multipart response never blocks
+	# beyond the deadline of the transaction.
+	def _connect(self):
+		sock = nlc.Socket(self._tx_cb)
+		sock.connect(nlc.NETLINK_GENERIC)
+		fd = nl.nl_socket_get_fd(sock._sock)
+		fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+		return sock
+
+	##
+	# Replaces the libnl socket, or the raw socket if raw is True, by a new
+	# one. This is done when a transaction is aborted as a late response
+	# would be taken for the response to the next request on the libnl
+	# socket. Multicast subscriptions of the socket are lost.
+	def _reconnect(self, raw=False):
+		if raw:
+			if self._rawsock != None:
+				self._rawsock.close()
+			self._rawsock = None
+			self._rawnl = None
+			self._rawpoller = None
+		else:
+			self._sock = self._connect()
+			self._poller = None
+
 	##
 	# Allocates a netlink message setup with genl header for nl80211 family.
 	def alloc_genlmsg(self, cmd, flags=0):
@@ -71,22 +193,256 @@ class access80211(object):
 		genl.genlmsg_put(msg._msg, 0, 0, self._family, 0, flags, cmd, 0)
 		return msg
 
+	##
+	# Returns netlink message for the given command which is only built
+	# once for the given key. Upon first use the message is allocated and
+	# put(msg) is called to add the attributes so the key must identify
+	# the attribute values, eg. the interface index. A cached message is
+	# returned with its sequence number reset so send() assigns the next
+	# one. The least recently used templates are dropped when there are
+	# more than ACCESS_MAX_TEMPLATES.
+	def genlmsg_template(self, cmd, flags, key, put):
+		tkey = (cmd, flags, key)
+		msg = self._templates.pop(tkey, None)
+		if msg == None:
+			msg = self.alloc_genlmsg(cmd, flags)
+			put(msg)
+			if len(self._templates) >= ACCESS_MAX_TEMPLATES:
+				self._templates.popitem(last=False)
+		else:
+			nl.nlmsg_hdr(msg._msg).nlmsg_seq = NL_AUTO_SEQ
+		self._templates[tkey] = msg
+		return msg
+
 	##
 	# Send netlink message to the kernel and wait for response. The provided
-	# handler will be called for NL_CB_VALID callback.
-	def send(self, msg, handler):
+	# handler will be called for NL_CB_VALID callback. When no response is
+	# received within the timeout (in seconds), which defaults to the one
+	# given upon creation, AccessTimeoutError is raised.
+	def send(self, msg, handler, timeout=None):
+		if self._raw:
+			return self.send_raw(msg, handler, timeout)
 		if not isinstance(handler, custom_handler):
 			raise Exception("provided 'handler' is not a custom_handler instance")
 		if self.busy == 1:
 			raise AccessBusyError()
 		self.busy = 1
+		deadline = self._deadline(timeout)
 		self._rx_cb.set_type(nl.NL_CB_VALID, nl.NL_CB_CUSTOM, handler.handle, None)
 		err = self._sock.send_auto_complete(msg)
-		while self.busy > 0 and not err < 0:
-			self._sock.recvmsgs(self._rx_cb)
-			err = self.busy
+		if err < 0:
+			self.busy = 0
+			return err
+		while self.busy > 0:
+			err = self._recvmsgs(deadline)
+			if err < 0 and self.busy > 0:
+				self.busy = 0
+				self._reconnect()
+				return err
+		return self.busy
+
+	##
+	# Waits until the libnl socket is readable and receives the messages
+	# using the receive callbacks. Returns the value of nl_recvmsgs(),
+	# which is negative upon failure, or 0 when the socket has no more
+	# data before the response is complete.
+	def _recvmsgs(self, deadline=None):
+		self._wait_readable(deadline)
+		err = nl.nl_recvmsgs(self._sock._sock, self._rx_cb._cb)
+		if err == -NLE_AGAIN:
+			return 0
 		return err
 
+	##
+	# Send netlink message to the kernel and parse the response(s) in python
+	# instead of using libnl. The provided handler will be called for each
+	# valid message using handle_raw().
+	def send_raw(self, msg, handler, timeout=None):
+		if not isinstance(handler, custom_handler):
+			raise Exception("provided 'handler' is not a custom_handler instance")
+		if self.busy == 1:
+			raise AccessBusyError()
+		self.busy = 1
+		deadline = self._deadline(timeout)
+		err = self._send_rawnl(msg)
+		if err < 0:
+			self.busy = 0
+			return err
+		msgs = self.recv_raw(nl.nlmsg_hdr(msg._msg).nlmsg_seq, deadline)
+		try:
+			for m in msgs:
+				handler.handle_raw(m)
+		finally:
+			self._drain_raw(msgs)
+		return self.busy
+
+	##
+	# Generator sending the netlink message and yielding the response(s)
+	# as nlraw.genl_msg instances as soon as they are received. When the
+	# caller stops early the remaining messages are drained without
+	# parsing them. Like send_raw() the busy flag holds the error value
+	# upon failure.
+	def dump_raw(self, msg, timeout=None):
+		if self.busy == 1:
+			raise AccessBusyError()
+		self.busy = 1
+		deadline = self._deadline(timeout)
+		err = self._send_rawnl(msg)
+		if err < 0:
+			self.busy = err
+			return
+		msgs = self.recv_raw(nl.nlmsg_hdr(msg._msg).nlmsg_seq, deadline)
+		try:
+			for m in msgs:
+				yield m
+		finally:
+			self._drain_raw(msgs)
+
+	##
+	# Receives the remaining responses of a raw transaction which was not
+	# completed, eg. because the handler raised an exception. The busy
+	# flag is cleared even when that fails so the instance can be used
+	# again.
+	def _drain_raw(self, msgs):
+		try:
+			for m in msgs:
+				pass
+		finally:
+			if self.busy > 0:
+				self.busy = 0
+
+	##
+	# Generator yielding the response messages for the given sequence
+	# number until the kernel signals completion. Like the default handlers
+	# the busy flag is cleared upon completion or holds the error value.
+	def recv_raw(self, seq, deadline=None):
+		sock = self.rawsock
+		while self.busy > 0:
+			self._wait_readable(deadline, True)
+			try:
+				buf = nlraw.recv(sock, NL_RECV_SIZE)
+			except socket.error as e:
+				if e.errno in [ errno.EAGAIN, errno.EWOULDBLOCK ]:
+					continue
+				raise
+			for m in nlraw.iter_msgs(buf):
+				if m.seq != seq:
+					continue
+				if m.type == nlraw.NLMSG_DONE:
+					self.busy = 0
+				elif m.type == nlraw.NLMSG_ERROR:
+					self.busy = m.error
+				elif m.type != nlraw.NLMSG_NOOP:
+					yield m
+					continue
+				break
+
+	##
+	# Returns the absolute deadline for the given timeout or the default
+	# timeout. None means waiting without limit.
+	def _deadline(self, timeout):
+		if timeout == None:
+			timeout = self._timeout
+		if timeout == None:
+			return None
+		return (time.time() + timeout, timeout)
+
+	##
+	# Waits until the libnl socket, or the raw socket if raw is True, is
+	# readable. When the deadline passes or the wait is cancelled the busy
+	# flag is cleared so the instance can be used again. The libnl socket
+	# is replaced as libnl would reject a late response with a sequence
+	# mismatch. On the raw socket late responses are dropped by recv_raw()
+	# as their sequence number does not match.
+	def _wait_readable(self, deadline, raw=False):
+		if raw:
+			if self._rawpoller == None:
+				self._rawpoller = select.poll()
+				self._rawpoller.register(self.rawsock.fileno(), select.POLLIN)
+			poller = self._rawpoller
+		else:
+			if self._poller == None:
+				self._poller = select.poll()
+				self._poller.register(nl.nl_socket_get_fd(self._sock._sock), select.POLLIN)
+			poller = self._poller
+		while True:
+			if self._cancelled:
+				self._cancelled = False
+				self._abort(raw)
+				raise AccessCancelledError()
+			wait = ACCESS_POLL_INTERVAL
+			if deadline != None:
+				remaining = deadline[0] - time.time()
+				if remaining <= 0:
+					self._abort(raw)
+					raise AccessTimeoutError(deadline[1])
+				wait = min(wait, remaining)
+			if len(poller.poll(wait * 1000)) > 0:
+				return
+
+	##
+	# Clears the busy flag when a wait is aborted replacing the libnl
+	# socket if that was used (see _wait_readable()).
+	def _abort(self, raw):
+		self.busy = 0
+		if not raw:
+			self._reconnect()
+
+	##
+	# Cancels the wait for a response in progress, eg. from another thread.
+	# The waiting call raises AccessCancelledError. When no wait is in
+	# progress the next one is cancelled unless reset() is called first.
+	def cancel(self):
+		self._cancelled = True
+
+	##
+	# Property (GET/SET) for the default timeout in seconds used by send()
+	# and dump_raw(). None means waiting without limit.
+	@property
+	def timeout(self):
+		return self._timeout
+
+	@timeout.setter
+	def timeout(self, timeout):
+		self._timeout = timeout
+
+	##
+	# Property (GET) for obtaining python socket object on the netlink
+	# socket used by send_raw() and dump_raw(). This is a separate socket
+	# on which libnl only sends so the responses received in python do not
+	# get libnl out of sync with the sequence numbers on the socket used
+	# by send().
+	@property
+	def rawsock(self):
+		if self._rawsock == None:
+			self._rawnl = self._connect()
+			fd = nl.nl_socket_get_fd(self._rawnl._sock)
+			self._rawsock = socket.fromfd(fd, socket.AF_NETLINK, socket.SOCK_RAW)
+			self._rawsock.setblocking(0)
+		return self._rawsock
+
+	##
+	# Sends the message on the raw socket letting libnl complete the
+	# header.
+	def _send_rawnl(self, msg):
+		self.rawsock
+		return self._rawnl.send_auto_complete(msg)
+
+	##
+	# Returns the libnl socket on which the responses are received, which
+	# is the one of the raw socket when send() uses send_raw().
+	def _recv_sock(self):
+		if self._raw:
+			self.rawsock
+			return self._rawnl
+		return self._sock
+
+	##
+	# Property (GET) indicating whether send() uses send_raw().
+	@property
+	def raw(self):
+		return self._raw
+
 	##
 	# Function effectively disables sequence number check.
 	def noseq(self, m, a):
@@ -103,19 +459,33 @@ class access80211(object):
 	def enalbe_seq_check(self):
 		self._rx_cb.set_type(nl.NL_CB_SEQ_CHECK, nl.NL_CB_DEFAULT, None, None)
 
+	##
+	# Restores the default callbacks and clears the busy flag and a pending
+	# cancel so the instance can be handed over to another user. When a
+	# transaction is still in progress the sockets are replaced so its
+	# responses are not received by the next user.
+	def reset(self):
+		self._rx_cb.set_type(nl.NL_CB_VALID, nl.NL_CB_DEFAULT, None, None)
+		self.enalbe_seq_check()
+		if self.busy > 0:
+			self._reconnect()
+			self._reconnect(True)
+		self.busy = 0
+		self._cancelled = False
+
 	##
 	# Subscribe to the provided multicast group for notifications.
 	def subscribe_multicast(self, mcname):
-		mcid = genl.genl_ctrl_resolve_grp(self._sock._sock, 'nl80211', mcname)
-		nl.nl_socket_add_membership(self._sock._sock, mcid)
+		mcid = ctrl.resolve_grp('nl80211', mcname)
+		nl.nl_socket_add_membership(self._recv_sock()._sock, mcid)
 		return mcid
 
 	##
 	# Unsubscribe from the provided multicast group.
 	def drop_multicast(self, mcid):
 		if isinstance(mcid, str):
-			mcid = genl.genl_ctrl_resolve_grp(self._sock._sock, 'nl80211', mcid)
-		nl.nl_socket_drop_membership(self._sock._sock, mcid)
+			mcid = ctrl.resolve_grp('nl80211', mcid)
+		nl.nl_socket_drop_membership(self._recv_sock()._sock, mcid)
 
 	##
 	# Property (GET) for obtaining the generic netlink family.
@@ -142,6 +512,280 @@ class access80211(object):
 		self.busy = err.error
 		return nl.NL_STOP
 
+##
+# Functions converting an unsigned value obtained from the attribute into
+# a signed value using 2s complement.
+def signed_getter(get, pol_type):
+	conv_tab = {
+		nl.NLA_U32: 0x80000000,
+		nl.NLA_U16: 0x8000,
+		nl.NLA_U8: 0x80
+	}
+	if not pol_type in conv_tab:
+		raise Exception("invalid type (%d) for sign conversion" % pol_type)
+	conv_check = conv_tab[pol_type]
+	def get_signed(attr):
+		val = get(attr)
+		if val & conv_check:
+			return val - (conv_check << 1)
+		return val
+	return get_signed
+
+##
+# Decode table compiled from a policy array. The nla and raw lists are
+# indexed by attribute id and hold the function decoding the libnl
+# attribute and the raw attribute payload respectively. The functions
+# are called with the nl80211_object instance and the attribute. A None
+# entry means the attribute is not stored.
+class policy_table(object):
+	def __init__(self, policy):
+		self._policy = policy
+		self.nla = []
+		self.raw = []
+		for aid in range(len(policy)):
+			(nla_dec, raw_dec) = self._compile(policy[aid], aid)
+			self.nla.append(nla_dec)
+			self.raw.append(raw_dec)
+
+	def _item_getters(self, pol, item_type):
+		nla_get = nla_getters[item_type]
+		raw_get = raw_getters[item_type]
+		if hasattr(pol, 'signed') and pol.signed:
+			nla_get = signed_getter(nla_get, item_type)
+			raw_get = signed_getter(raw_get, item_type)
+		return (nla_get, raw_get)
+
+	##
+	# Decoders for attributes that can not be decoded. The raised exception
+	# results in storing the attribute payload.
+	def _unsupported(self, msg):
+		def unsupported(obj, attr):
+			raise Exception(msg)
+		return (unsupported, unsupported)
+
+	def _compile(self, pol, aid):
+		if pol.type in nla_getters:
+			(nla_get, raw_get) = self._item_getters(pol, pol.type)
+			return (lambda obj, attr: nla_get(attr),
+				lambda obj, attr: raw_get(attr))
+		elif pol.type == nl.NLA_FLAG:
+			return (lambda obj, attr: True, lambda obj, attr: True)
+		elif pol.type in [ NLA_BINARY, nl.NLA_UNSPEC ]:
+			return (lambda obj, attr: nl.nla_data(attr),
+				lambda obj, attr: nlraw.get_data(attr))
+		elif pol.type != nl.NLA_NESTED:
+			return (None, None)
+
+		if hasattr(pol, 'single') and pol.single:
+			return (lambda obj, attr: obj.create_nested(attr, aid),
+				lambda obj, attr: obj.create_nested_raw(attr, aid, aid))
+		is_map = hasattr(pol, 'map') and pol.map
+		if not hasattr(pol, 'list_type'):
+			if is_map:
+				return self._unsupported('need to specify "list_type" for map')
+			return (lambda obj, attr: obj.create_nested_list(attr, aid),
+				lambda obj, attr: obj.create_nested_list_raw(attr, aid))
+		if not pol.list_type in nla_getters:
+			return self._unsupported("type (%d) not supported for list" % pol.list_type)
+
+		(nla_get, raw_get) = self._item_getters(pol, pol.list_type)
+		if is_map:
+			def nla_map(obj, attr):
+				nest_map = {}
+				for key in nl.nla_get_nested(attr):
+					nest_list = [ nla_get(item) for item in nl.nla_get_nested(key) ]
+					if len(nest_list) > 0:
+						nest_map[nl.nla_type(key)] = nest_list
+				return nest_map
+			def raw_map(obj, attr):
+				nest_map = {}
+				for key, data in nlraw.iter_attrs(attr):
+					nest_list = [ raw_get(item) for t, item in nlraw.iter_attrs(data) ]
+					if len(nest_list) > 0:
+						nest_map[key] = nest_list
+				return nest_map
+			return (nla_map, raw_map)
+		return (lambda obj, attr: [ nla_get(item) for item in nl.nla_get_nested(attr) ],
+			lambda obj, attr: [ raw_get(item) for t, item in nlraw.iter_attrs(attr) ])
+
+_policy_tables = {}
+
+##
+# Returns the decode table for the given policy array compiling it when
+# this is the first request for that policy.
+def compile_policy(policy):
+	if policy == None:
+		return None
+	try:
+		return _policy_tables[id(policy)]
+	except KeyError:
+		table = policy_table(policy)
+		_policy_tables[id(policy)] = table
+		return table
+
+##
+# Projection selecting the attributes to be decoded. Attributes outside
+# the projection are skipped without decoding them. Both only and exclude
+# can be a list of attribute ids or a dict mapping attribute id to the
+# projection of the nested attribute, eg.:
+#
+#	only={ nl80211.ATTR_MAC: None,
+#	       nl80211.ATTR_STA_INFO: [ nl80211.STA_INFO_SIGNAL ] }
+#
+# A value of None selects (only) or skips (exclude) the whole attribute.
+# The attribute ids in required are always selected.
+class projection(object):
+	def __init__(self, only=None, exclude=None, required=[]):
+		self._only = None
+		self._exclude = set()
+		self._nested = {}
+		if only != None:
+			self._only = set(only) | set(required)
+			self._add_nested(only, 'only')
+		if exclude != None:
+			if isinstance(exclude, dict):
+				self._exclude = set([ aid for aid in exclude.keys() if exclude[aid] == None ])
+			else:
+				self._exclude = set(exclude)
+			self._exclude -= set(required)
+			self._add_nested(exclude, 'exclude')
+
+	def _add_nested(self, spec, kind):
+		if not isinstance(spec, dict):
+			return
+		for aid in spec.keys():
+			if spec[aid] == None:
+				continue
+			if aid in self._nested:
+				raise Exception("attribute %d has nested projection in only and exclude" % aid)
+			if isinstance(spec[aid], projection):
+				self._nested[aid] = spec[aid]
+			elif kind == 'only':
+				self._nested[aid] = projection(only=spec[aid])
+			else:
+				self._nested[aid] = projection(exclude=spec[aid])
+
+	##
+	# Returns the attribute ids out of the given ones that are selected.
+	def select(self, aids):
+		if self._only != None:
+			return [ aid for aid in aids if aid in self._only and not aid in self._exclude ]
+		return [ aid for aid in aids if not aid in self._exclude ]
+
+	##
+	# Returns the projection for the given nested attribute or None.
+	def nested(self, aid):
+		return self._nested.get(aid)
+
+##
+# Returns a projection instance for the only and exclude arguments as
+# taken by the list classes, or None if there is nothing to project.
+def make_projection(only=None, exclude=None, required=[]):
+	if only == None and exclude == None:
+		return None
+	return projection(only, exclude, required)
+
+##
+# Attribute mapping of nl80211_object. Attributes stored from the raw
+# path are kept as memoryview on the receive buffer and are decoded
+# using the decode table of the owning object the first time they are
+# accessed. The decoded value replaces the raw payload so each attribute
+# is decoded only once. The reference to the owning object is dropped
+# when all attributes are decoded. It is not derived from MutableMapping
+# as its base classes do not define __slots__ and would give every
+# instance a __dict__. The mixin methods are taken from MutableMapping
+# instead and the class is registered with it below.
+class lazy_attrs(object):
+	__slots__ = ('_obj', '_values', '_raw')
+	__hash__ = None
+
+	def __init__(self):
+		self._obj = None
+		self._values = {}
+		self._raw = {}
+
+	##
+	# Stores the raw payload of the given attributes to be decoded by obj
+	# upon first access.
+	def store_raw(self, obj, attrs, aids):
+		values = self._values
+		raw = self._raw
+		for aid in aids:
+			if aid in values:
+				del values[aid]
+			raw[aid] = attrs[aid]
+		if len(raw) > 0:
+			self._obj = obj
+
+	def __getitem__(self, aid):
+		raw = self._raw
+		if not aid in raw:
+			return self._values[aid]
+		data = raw.pop(aid)
+		obj = self._obj
+		if len(raw) == 0:
+			self._obj = None
+		try:
+			val = obj._table.raw[aid](obj, data)
+		except Exception as e:
+			print e.message
+			val = nlraw.get_data(data)
+		self._values[aid] = val
+		return val
+
+	def __setitem__(self, aid, val):
+		self._raw.pop(aid, None)
+		self._values[aid] = val
+
+	def __delitem__(self, aid):
+		if aid in self._raw:
+			del self._raw[aid]
+		else:
+			del self._values[aid]
+
+	def __contains__(self, aid):
+		return aid in self._values or aid in self._raw
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self._values) + len(self._raw)
+
+	def keys(self):
+		return self._values.keys() + self._raw.keys()
+
+	##
+	# Decodes all attributes that have not been accessed yet.
+	def materialize(self):
+		for aid in self._raw.keys():
+			self[aid]
+
+	def values(self):
+		self.materialize()
+		return self._values.values()
+
+	def items(self):
+		self.materialize()
+		return self._values.items()
+
+	def __repr__(self):
+		return repr(dict(self.items()))
+
+	get = MutableMapping.get.__func__
+	pop = MutableMapping.pop.__func__
+	popitem = MutableMapping.popitem.__func__
+	clear = MutableMapping.clear.__func__
+	update = MutableMapping.update.__func__
+	setdefault = MutableMapping.setdefault.__func__
+	iterkeys = MutableMapping.iterkeys.__func__
+	itervalues = MutableMapping.itervalues.__func__
+	iteritems = MutableMapping.iteritems.__func__
+	__eq__ = MutableMapping.__eq__.__func__
+	__ne__ = MutableMapping.__ne__.__func__
+
+MutableMapping.register(lazy_attrs)
+
 ##
 # main object which deals with storing the attributes converting them to
 # python objects as specified by provided policy and nest_attr_map. The
@@ -149,9 +793,14 @@ class access80211(object):
 # which consists of tuple specifying class, maximum number of attributes and
 # the policy of each nested attribute.
 class nl80211_object(object):
-	def __init__(self, attrs, policy=None):
-		self._attrs = {}
+	_proj = None
+
+	def __init__(self, attrs, policy=None, proj=None):
+		self._attrs = lazy_attrs()
 		self._policy = policy
+		self._table = compile_policy(policy)
+		if proj != None:
+			self._proj = proj
 		if attrs != None:
 			self.store_attrs(attrs)
 
@@ -163,10 +812,20 @@ class nl80211_object(object):
 			if aid in self.nest_attr_map.keys():
 				(nest_class, max_nest, nest_policy) = self.nest_attr_map[aid]
 			e, nattr = nl.py_nla_parse_nested(max_nest, attr, nest_policy)
-			return factory.get_inst().create(nest_class, nattr, nest_policy)
+			return self.create_nested_obj(nest_class, nattr, nest_policy, aid)
 		except Exception as e:
 			return nl.nla_type(attr)
 
+	##
+	# Instantiates the nested class passing the projection for the nested
+	# attribute if there is one.
+	def create_nested_obj(self, nest_class, nattr, nest_policy, aid):
+		if self._proj != None:
+			proj = self._proj.nested(aid)
+			if proj != None:
+				return factory.get_inst().create(nest_class, nattr, nest_policy, proj=proj)
+		return factory.get_inst().create(nest_class, nattr, nest_policy)
+
 	##
 	# Creates a nested attribute list adding a new instance
 	# for each nested element.
@@ -177,58 +836,6 @@ class nl80211_object(object):
 			nest_list.append(nest_obj)
 		return nest_list
 
-	##
-	# Creates a list of attributes that are a basic type.
-	def create_list(self, attr_list, pol):
-		nest_list = []
-		item_type = pol.list_type
-		for item in nl.nla_get_nested(attr_list):
-			if item_type == NLA_NUL_STRING:
-				nest_obj = nl.nla_get_string(item)
-			elif item_type == nl.NLA_U64:
-				nest_obj = nl.nla_get_u64(item)
-			elif item_type == nl.NLA_U32:
-				nest_obj = nl.nla_get_u32(item)
-			elif item_type == nl.NLA_U16:
-				nest_obj = nl.nla_get_u16(item)
-			elif item_type == nl.NLA_U8:
-				nest_obj = nl.nla_get_u8(item)
-			else:
-				raise Exception("type (%d) not supported for list" % item_type)
-			nest_list.append(nest_obj)
-		return nest_list
-
-	def create_map(self, map_attr, pol):
-		nest_map = {}
-		for key in nl.nla_get_nested(map_attr):
-			nest_list = self.create_list(key, pol)
-			if len(nest_list) > 0:
-				nest_map[nl.nla_type(key)] = nest_list
-		return nest_map
-
-	##
-	# Do a 2s complement sign conversion on attribute
-	# which may be a list of values.
-	def convert_sign(self, attr, pol):
-		conv_tab = {
-			nl.NLA_U32: 0x80000000,
-			nl.NLA_U16: 0x8000,
-			nl.NLA_U8: 0x80
-		}
-		pol_type = pol.type
-		if pol.type == nl.NLA_NESTED:
-			pol_type = pol.list_type
-		if not pol_type in conv_tab:
-			raise Exception("invalid type (%d) for sign conversion" % pol_type)
-		conv_check = conv_tab[pol_type]
-		if pol.type != nl.NLA_NESTED:
-			if attr & conv_check:
-				return -conv_check + (attr & (conv_check - 1))
-		else:
-			for aid in range(len(attr)):
-				attr[aid] = -conv_check + (attr[aid] & (conv_check - 1))
-		return attr
-
 	##
 	# Called after storing the netlink attributes. This allows doing any custom
 	# post-processing of the netlink attributes by overriding this method.
@@ -236,59 +843,220 @@ class nl80211_object(object):
 		pass
 
 	##
-	# Stores the attributes using the appropriate nla_get function
-	# according the provided policy.
+	# Stores the attributes using the decode table compiled from
+	# the provided policy. Attributes beyond the policy are stored
+	# as raw data.
 	def store_attrs(self, attrs):
-		for aid in attrs.keys():
+		if isinstance(attrs, nlraw.raw_attrs):
+			self.store_raw_attrs(attrs)
+			return
+		decoders = self._table.nla
+		maxtype = len(decoders)
+		aids = attrs.keys()
+		if self._proj != None:
+			aids = self._proj.select(aids)
+		for aid in aids:
+			if aid >= maxtype:
+				self._attrs[aid] = nl.nla_data(attrs[aid])
+				continue
+			dec = decoders[aid]
+			if dec == None:
+				continue
 			try:
-				pol = self._policy[aid]
-				if pol.type == NLA_NUL_STRING:
-					self._attrs[aid] = nl.nla_get_string(attrs[aid])
-				elif pol.type == nl.NLA_U64:
-					self._attrs[aid] = nl.nla_get_u64(attrs[aid])
-				elif pol.type == nl.NLA_U32:
-					self._attrs[aid] = nl.nla_get_u32(attrs[aid])
-				elif pol.type == nl.NLA_U16:
-					self._attrs[aid] = nl.nla_get_u16(attrs[aid])
-				elif pol.type == nl.NLA_U8:
-					self._attrs[aid] = nl.nla_get_u8(attrs[aid])
-				elif pol.type == nl.NLA_FLAG:
-					self._attrs[aid] = True
-				elif pol.type == nl.NLA_NESTED:
-					if hasattr(pol, 'single') and pol.single:
-						obj = self.create_nested(attrs[aid], aid)
-					elif hasattr(pol, 'map') and pol.map:
-						if not hasattr(pol, 'list_type'):
-							raise Exception('need to specify "list_type" for map')
-						obj = self.create_map(attrs[aid], pol)
-					elif hasattr(pol, 'list_type'):
-						obj = self.create_list(attrs[aid], pol)
-					else:
-						obj = self.create_nested_list(attrs[aid], aid)
-					self._attrs[aid] = obj
-				elif pol.type in [ NLA_BINARY, nl.NLA_UNSPEC ]:
-					self._attrs[aid] = nl.nla_data(attrs[aid])
-				if hasattr(pol, 'signed') and pol.signed:
-					self._attrs[aid] = self.convert_sign(self._attrs[aid], pol)
+				self._attrs[aid] = dec(self, attrs[aid])
 			except Exception as e:
 				print e.message
 				self._attrs[aid] = nl.nla_data(attrs[aid])
 		self.post_store_attrs(attrs)
 
+	##
+	# Creates a new instance for the nested attribute from the raw
+	# attribute payload according the nest_attr_map.
+	def create_nested_raw(self, data, aid, nla_type):
+		try:
+			(nest_class, max_nest, nest_policy) = self.nest_attr_map[aid]
+			nattr = nlraw.parse_attrs(data, max_nest)
+			return self.create_nested_obj(nest_class, nattr, nest_policy, aid)
+		except Exception as e:
+			return nla_type
+
+	##
+	# Creates a nested attribute list from the raw attribute payload
+	# adding a new instance for each nested element.
+	def create_nested_list_raw(self, data, aid):
+		nest_list = []
+		for nla_type, nest_element in nlraw.iter_attrs(data):
+			nest_list.append(self.create_nested_raw(nest_element, aid, nla_type))
+		return nest_list
+
+	##
+	# Stores the attributes parsed by nlraw module. The payload is only
+	# decoded when the attribute is accessed (see lazy_attrs).
+	def store_raw_attrs(self, attrs):
+		decoders = self._table.raw
+		maxtype = len(decoders)
+		aids = attrs.keys()
+		if self._proj != None:
+			aids = self._proj.select(aids)
+		extra = [ aid for aid in aids if aid >= maxtype ]
+		aids = [ aid for aid in aids if aid < maxtype and decoders[aid] != None ]
+		self._attrs.store_raw(self, attrs, aids)
+		for aid in extra:
+			self._attrs[aid] = nlraw.get_data(attrs[aid])
+		self.post_store_attrs(attrs)
+
 	##
 	# Property (GET) for obtaining the attributes.
 	@property
 	def attrs(self):
 		return self._attrs
 
+##
+# Compact representation of a nested attribute that only holds basic
+# types. The attributes are stored in slots so no instance dictionary is
+# needed. The record provides the mapping interface itself and the attrs
+# property returns the record so it can be used like nl80211_object.
+# Derived classes are created using record_class(). Records are created
+# through the factory like other nested objects so the pyro daemon can
+# register them, which needs the slots for the attributes it sets.
+# Attributes beyond the policy are kept as raw data in a dictionary that
+# is only created when such an attribute is received.
+class nl80211_record(object):
+	__slots__ = ('_pyroId', '_pyroDaemon', '_extra')
+	_slots = ()
+	_table = None
+
+	def __init__(self, attrs, policy=None, proj=None):
+		if attrs != None:
+			self.store_attrs(attrs, proj)
+
+	def store_attrs(self, attrs, proj=None):
+		if isinstance(attrs, nlraw.raw_attrs):
+			decoders = self._table.raw
+			get_data = nlraw.get_data
+		else:
+			decoders = self._table.nla
+			get_data = nl.nla_data
+		slots = self._slots
+		maxtype = len(slots)
+		aids = attrs.keys()
+		if proj != None:
+			aids = proj.select(aids)
+		for aid in aids:
+			if aid >= maxtype:
+				self._store_extra(aid, get_data(attrs[aid]))
+				continue
+			if slots[aid] == None:
+				continue
+			try:
+				val = decoders[aid](self, attrs[aid])
+			except Exception as e:
+				print e.message
+				val = get_data(attrs[aid])
+			setattr(self, slots[aid], val)
+
+	def _store_extra(self, aid, val):
+		try:
+			self._extra[aid] = val
+		except AttributeError:
+			self._extra = { aid: val }
+
+	def _get_extra(self):
+		try:
+			return self._extra
+		except AttributeError:
+			return {}
+
+	##
+	# Property (GET) for obtaining the attributes.
+	@property
+	def attrs(self):
+		return self
+
+	def __getitem__(self, aid):
+		try:
+			return getattr(self, self._slots[aid])
+		except IndexError:
+			try:
+				return self._get_extra()[aid]
+			except TypeError:
+				raise KeyError(aid)
+		except (TypeError, AttributeError):
+			raise KeyError(aid)
+
+	def __setitem__(self, aid, val):
+		try:
+			setattr(self, self._slots[aid], val)
+		except IndexError:
+			self._store_extra(aid, val)
+		except TypeError:
+			raise KeyError(aid)
+
+	def __contains__(self, aid):
+		try:
+			return hasattr(self, self._slots[aid])
+		except IndexError:
+			return aid in self._get_extra()
+		except TypeError:
+			return False
+
+	def get(self, aid, default=None):
+		try:
+			return self[aid]
+		except KeyError:
+			return default
+
+	def keys(self):
+		return [ aid for aid, slot in enumerate(self._slots)
+			 if slot != None and hasattr(self, slot) ] + self._get_extra().keys()
+
+	def values(self):
+		return [ self[aid] for aid in self.keys() ]
+
+	def items(self):
+		return [ (aid, self[aid]) for aid in self.keys() ]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __repr__(self):
+		return '%s(%r)' % (type(self).__name__, dict(self.items()))
+
+##
+# Creates a record class for the given policy with a slot for each
+# attribute that is stored. Only basic types are supported so nested
+# attributes in the policy raise an exception. Typical use is:
+#
+#	class wiphy_rate(record_class(rate_policy)):
+#		__slots__ = ()
+def record_class(policy):
+	table = compile_policy(policy)
+	slots = []
+	for aid in range(len(policy)):
+		if policy[aid].type == nl.NLA_NESTED:
+			raise Exception("nested attribute (%d) not supported in record" % aid)
+		if table.raw[aid] == None:
+			slots.append(None)
+		else:
+			slots.append('_a%d' % aid)
+	members = {
+		'__slots__': tuple([ slot for slot in slots if slot != None ]),
+		'_slots': tuple(slots),
+		'_table': table
+	}
+	return type('nl80211_record', (nl80211_record,), members)
+
 ##
 # The managed object can be used for objects whose data is obtained
 # using a specific command. The derived class needs to specify the
 # NL80211 command (self._cmd) to use and implement abstract method
 # put_obj_id() putting PHY, NETDEV, or WDEV as needed.
 class nl80211_managed_object(nl80211_object, custom_handler):
-	def __init__(self, access, attrs, policy=None):
-		nl80211_object.__init__(self, attrs, policy)
+	def __init__(self, access, attrs, policy=None, proj=None):
+		nl80211_object.__init__(self, attrs, policy, proj)
 		if access == None:
 			self._access = access80211()
 		else:
@@ -309,12 +1077,25 @@ class nl80211_managed_object(nl80211_object, custom_handler):
 	def put_obj_id(m):
 		pass
 
+	##
+	# Returns the key identifying the attributes added by put_obj_id() so
+	# the refresh message can be reused (see access80211.genlmsg_template)
+	# or None if the message must be built every time.
+	def obj_key(self):
+		return None
+
 	##
 	# Refresh object data by sending a new netlink message to the kernel.
+	# Returns the result of the send() method of the access instance.
 	def refresh(self):
-		m = self._access.alloc_genlmsg(self.objcmd, nlc.NLM_F_REQUEST | nlc.NLM_F_ACK)
-		self.put_obj_id(m)
-		self._access.send(m, self)
+		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK
+		key = self.obj_key()
+		if key == None:
+			m = self._access.alloc_genlmsg(self.objcmd, flags)
+			self.put_obj_id(m)
+		else:
+			m = self._access.genlmsg_template(self.objcmd, flags, key, self.put_obj_id)
+		return self._access.send(m, self)
 
 	##
 	# Valid handler parsing the response(s) and store the attributes.
@@ -328,3 +1109,13 @@ class nl80211_managed_object(nl80211_object, custom_handler):
 			print v.message
 			traceback.print_tb(tb)
 
+	##
+	# Raw handler storing the attributes of the response(s).
+	def handle_raw(self, msg):
+		try:
+			self.store_attrs(msg.attrs)
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
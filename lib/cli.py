@@ -19,6 +19,7 @@
 #
 import py80211.generated.defs as nl80211
 from py80211 import wiphy
+from py80211 import ie
 
 def bitfield2str(label, value, size, spec):
 	"""
@@ -133,8 +134,8 @@ class wiphy_info(object):
 	def __str__(self):
 		"phy%d" % self._wiphy.phynum
 
-WLAN_EID_SSID = 0
-WLAN_EID_COUNTRY = 7
+WLAN_EID_SSID = ie.WLAN_EID_SSID
+WLAN_EID_COUNTRY = ie.WLAN_EID_COUNTRY
 
 chanwidth2str = [
 	'20 MHz (no-ht)',
@@ -152,13 +153,7 @@ class bss_info(object):
 		self._bss = bss
 
 	def find_ie(self, ies, eid):
-		while len(ies) > 2 and ies[0] != eid:
-			ies = ies[ies[1]+2:]
-		if len(ies) < 2:
-			return None
-		if len(ies) < 2 + ies[1]:
-			return None
-		return ies[0:2+ies[1]]
+		return ie.ie_index(ies).element(eid)
 
 	def __str__(self):
 		s = ''
@@ -166,14 +161,13 @@ class bss_info(object):
 		s = 'BSS: %02x' % bssid[0]
 		for b in bssid[1:6]:
 			s += ':%02x' % b
-		ies = self._bss.attrs[nl80211.BSS_INFORMATION_ELEMENTS]
-		ssid = self.find_ie(ies, WLAN_EID_SSID)
-		s += '\n SSID: %s' % str(ssid[2:])
+		ies = self._bss.ies
+		s += '\n SSID: %s' % ies.ssid()
 		s += '\n Freq: %d MHz' % self._bss.attrs[nl80211.BSS_FREQUENCY]
 		s += ' @ %s' % chanwidth2str[self._bss.attrs[nl80211.BSS_CHAN_WIDTH]]
-		country = self.find_ie(ies, WLAN_EID_COUNTRY)
+		country = ies.country()
 		if country:
-			s += '\n Country: %s' % str(country[2:4])
+			s += '\n Country: %s' % country[0][0:2]
 		s += '\n Interval: %d' % self._bss.attrs[nl80211.BSS_BEACON_INTERVAL]
 		s += '\n TSF: %d' % self._bss.attrs[nl80211.BSS_TSF]
 		s += '\n Last seen: %d ms' % self._bss.attrs[nl80211.BSS_SEEN_MS_AGO]
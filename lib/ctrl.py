@@ -0,0 +1,186 @@
+##
+# Module providing a process-wide cache of generic netlink family and
+# multicast group ids.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import socket
+import errno
+import threading
+
+import nlraw
+
+GENL_ID_CTRL = 0x10
+
+CTRL_CMD_NEWFAMILY = 1
+CTRL_CMD_DELFAMILY = 2
+CTRL_CMD_GETFAMILY = 3
+
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+##
+# Cache of the generic netlink families and their multicast groups. It is
+# filled with a single CTRL_CMD_GETFAMILY dump and it listens to the
+# notifications of the genl controller. A family is dropped from the
+# cache when the controller reports that it was removed or (re-)added
+# and it is requested again on its next lookup.
+class family_cache(object):
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._families = None
+		self._notify = nlraw.open_socket()
+		nlraw.add_membership(self._notify, GENL_ID_CTRL)
+		self._notify.setblocking(0)
+
+	def _load(self):
+		families = {}
+		flags = nlraw.NLM_F_REQUEST | nlraw.NLM_F_DUMP
+		self._request(families, flags)
+		return families
+
+	##
+	# Requests a single family which is not (or no longer) in the cache.
+	# Returns None when the family does not exist.
+	def _load_family(self, name):
+		payload = nlraw.nla_put_string(CTRL_ATTR_FAMILY_NAME, name)
+		try:
+			self._request(self._families, nlraw.NLM_F_REQUEST, payload)
+		except socket.error as e:
+			if e.errno != errno.ENOENT:
+				raise
+		return self._families.get(name)
+
+	def _request(self, families, flags, payload=''):
+		sock = nlraw.open_socket()
+		try:
+			sock.send(nlraw.build_genlmsg(GENL_ID_CTRL, flags, 1, CTRL_CMD_GETFAMILY, payload))
+			done = False
+			while not done:
+				buf = bytearray(65536)
+				size = sock.recv_into(buf)
+				for m in nlraw.iter_msgs(buf, size):
+					if m.type == nlraw.NLMSG_DONE:
+						done = True
+						break
+					if m.type == nlraw.NLMSG_ERROR:
+						raise socket.error(-m.error, 'CTRL_CMD_GETFAMILY failed')
+					if m.type == GENL_ID_CTRL and m.cmd == CTRL_CMD_NEWFAMILY:
+						self._store_family(families, m.attrs)
+						if not flags & nlraw.NLM_F_DUMP:
+							done = True
+		finally:
+			sock.close()
+
+	def _store_family(self, families, attrs):
+		name = nlraw.get_string(attrs[CTRL_ATTR_FAMILY_NAME])
+		groups = {}
+		if CTRL_ATTR_MCAST_GROUPS in attrs:
+			for i, grp in nlraw.iter_attrs(attrs[CTRL_ATTR_MCAST_GROUPS]):
+				gattrs = nlraw.parse_attrs(grp)
+				gname = nlraw.get_string(gattrs[CTRL_ATTR_MCAST_GRP_NAME])
+				groups[gname] = nlraw.get_u32(gattrs[CTRL_ATTR_MCAST_GRP_ID])
+		families[name] = (nlraw.get_u16(attrs[CTRL_ATTR_FAMILY_ID]), groups)
+
+	##
+	# Handles pending controller notifications. Only the entry of the
+	# family that was removed or (re-)added is dropped from the cache.
+	def _check_notifications(self):
+		while True:
+			buf = bytearray(65536)
+			try:
+				size = self._notify.recv_into(buf)
+			except socket.error as e:
+				if e.errno in [ errno.EAGAIN, errno.EWOULDBLOCK ]:
+					return
+				# notifications may have been lost.
+				self._families = None
+				continue
+			for m in nlraw.iter_msgs(buf, size):
+				if m.type != GENL_ID_CTRL:
+					continue
+				if m.cmd in [ CTRL_CMD_NEWFAMILY, CTRL_CMD_DELFAMILY ]:
+					self._drop_family(m.attrs)
+
+	##
+	# Drops the cache entry of the family in a controller notification.
+	# The entry is looked up by name or else by id. The whole cache is
+	# dropped when the notification identifies neither.
+	def _drop_family(self, attrs):
+		if self._families == None:
+			return
+		if CTRL_ATTR_FAMILY_NAME in attrs:
+			name = nlraw.get_string(attrs[CTRL_ATTR_FAMILY_NAME])
+			self._families.pop(name, None)
+		elif CTRL_ATTR_FAMILY_ID in attrs:
+			fid = nlraw.get_u16(attrs[CTRL_ATTR_FAMILY_ID])
+			for name, family in self._families.items():
+				if family[0] == fid:
+					del self._families[name]
+		else:
+			self._families = None
+
+	def _lookup(self, name):
+		with self._lock:
+			self._check_notifications()
+			if self._families == None:
+				self._families = self._load()
+			elif not name in self._families:
+				return self._load_family(name)
+			return self._families.get(name)
+
+	##
+	# Returns the id of the given generic netlink family or negative
+	# error value like genl_ctrl_resolve().
+	def resolve(self, name):
+		family = self._lookup(name)
+		if family == None:
+			return -errno.ENOENT
+		return family[0]
+
+	##
+	# Returns the id of the multicast group of the given generic netlink
+	# family or negative error value like genl_ctrl_resolve_grp().
+	def resolve_grp(self, name, grp):
+		family = self._lookup(name)
+		if family == None or not grp in family[1]:
+			return -errno.ENOENT
+		return family[1][grp]
+
+	##
+	# Drops all cached families.
+	def invalidate(self):
+		with self._lock:
+			self._families = None
+
+_inst = None
+_inst_lock = threading.Lock()
+
+def get_inst():
+	with _inst_lock:
+		if globals()['_inst'] == None:
+			globals()['_inst'] = family_cache()
+		return globals()['_inst']
+
+def resolve(name):
+	return get_inst().resolve(name)
+
+def resolve_grp(name, grp):
+	return get_inst().resolve_grp(name, grp)
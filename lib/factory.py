@@ -37,10 +37,15 @@ class py80211_simple_factory(py80211_factory):
 # and registers the object instance with pyro daemon.
 class py80211_pyro_factory(py80211_factory):
 	def __init__(self, daemon):
+		import Pyro4 as pyro
+		from base import lazy_attrs
 		if daemon == None:
-			import Pyro4 as pyro
 			daemon = pyro.Daemon()
 		self._daemon = daemon
+		# the attributes are sent as plain dict so the client does
+		# not depend on the lazy decoding.
+		pyro.util.SerializerBase.register_class_to_dict(lazy_attrs,
+			lambda obj: dict(obj.items()))
 
 	def create(self, cls, *args, **kwargs):
 		obj = cls(*args, **kwargs)
@@ -0,0 +1,192 @@
+##
+# Module providing parsing of 802.11 information elements.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import struct
+
+WLAN_EID_SSID = 0
+WLAN_EID_SUPP_RATES = 1
+WLAN_EID_DS_PARAMS = 3
+WLAN_EID_TIM = 5
+WLAN_EID_COUNTRY = 7
+WLAN_EID_HT_CAPABILITY = 45
+WLAN_EID_RSN = 48
+WLAN_EID_EXT_SUPP_RATES = 50
+WLAN_EID_HT_OPERATION = 61
+WLAN_EID_VHT_CAPABILITY = 191
+WLAN_EID_VHT_OPERATION = 192
+WLAN_EID_VENDOR_SPECIFIC = 221
+WLAN_EID_EXTENSION = 255
+
+_u8 = struct.Struct('<B')
+_u16 = struct.Struct('<H')
+_u32 = struct.Struct('<I')
+_ht_capa = struct.Struct('<HB')
+_vht_capa = struct.Struct('<IHHHH')
+_suite = struct.Struct('>I')
+
+##
+# Index over a buffer holding information elements. The elements are
+# located in a single pass and the index stores the offset and length
+# of the payload for each element id, so no data is copied. Element ids
+# may occur more than once, eg. vendor specific elements, in which case
+# all of them are kept in order of appearance. Elements with id 255 are
+# indexed by their extended element id as well.
+class ie_index(object):
+	def __init__(self, data):
+		self._data = data
+		self._view = memoryview(data)
+		self._index = {}
+		self._ext_index = {}
+		view = self._view
+		size = len(view)
+		offset = 0
+		while offset + 2 <= size:
+			eid, length = struct.unpack_from('BB', view, offset)
+			start = offset + 2
+			end = start + length
+			if end > size:
+				break
+			self._index.setdefault(eid, []).append((start, end))
+			if eid == WLAN_EID_EXTENSION and length > 0:
+				ext_eid = _u8.unpack_from(view, start)[0]
+				self._ext_index.setdefault(ext_eid, []).append((start + 1, end))
+			offset = end
+
+	def __contains__(self, eid):
+		return eid in self._index
+
+	##
+	# Returns the element ids present in the buffer.
+	def keys(self):
+		return self._index.keys()
+
+	##
+	# Returns memoryview on the payload of the first element with given
+	# id or None if there is no such element.
+	def get(self, eid):
+		try:
+			start, end = self._index[eid][0]
+		except KeyError:
+			return None
+		return self._view[start:end]
+
+	##
+	# Returns list of memoryview on the payload of all elements with the
+	# given id.
+	def get_all(self, eid):
+		return [ self._view[start:end] for start, end in self._index.get(eid, []) ]
+
+	##
+	# Returns memoryview on the payload of the first extended element with
+	# given extended element id, which is not included in the payload.
+	def get_ext(self, ext_eid):
+		try:
+			start, end = self._ext_index[ext_eid][0]
+		except KeyError:
+			return None
+		return self._view[start:end]
+
+	##
+	# Returns copy of the first element with given id including the
+	# element header like cli.bss_info.find_ie() does or None.
+	def element(self, eid):
+		try:
+			start, end = self._index[eid][0]
+		except KeyError:
+			return None
+		return self._data[start - 2:end]
+
+	def ssid(self):
+		data = self.get(WLAN_EID_SSID)
+		if data == None:
+			return None
+		return data.tobytes()
+
+	##
+	# Returns the country element as tuple of the country string and a
+	# list of (first channel, number of channels, max tx power) triplets.
+	def country(self):
+		data = self.get(WLAN_EID_COUNTRY)
+		if data == None or len(data) < 3:
+			return None
+		triplets = []
+		for offset in range(3, len(data) - 2, 3):
+			triplets.append(struct.unpack_from('BBB', data, offset))
+		return (data[0:3].tobytes(), triplets)
+
+	##
+	# Returns the RSN element as dictionary. The cipher and AKM suites
+	# are given as 32-bit value holding the OUI and suite type.
+	def rsn(self):
+		data = self.get(WLAN_EID_RSN)
+		if data == None or len(data) < 2:
+			return None
+		rsn = { 'version': _u16.unpack_from(data, 0)[0] }
+		offset = 2
+		if offset + 4 > len(data):
+			return rsn
+		rsn['group'] = _suite.unpack_from(data, offset)[0]
+		offset += 4
+		for name in [ 'pairwise', 'akm' ]:
+			if offset + 2 > len(data):
+				return rsn
+			count = _u16.unpack_from(data, offset)[0]
+			offset += 2
+			if offset + 4 * count > len(data):
+				return rsn
+			rsn[name] = [ _suite.unpack_from(data, offset + 4 * i)[0] for i in range(count) ]
+			offset += 4 * count
+		if offset + 2 <= len(data):
+			rsn['capabilities'] = _u16.unpack_from(data, offset)[0]
+		return rsn
+
+	##
+	# Returns the HT capabilities as dictionary with the capability info,
+	# A-MPDU parameters and the supported MCS set.
+	def ht_capa(self):
+		data = self.get(WLAN_EID_HT_CAPABILITY)
+		if data == None or len(data) < 19:
+			return None
+		info, ampdu = _ht_capa.unpack_from(data, 0)
+		return { 'info': info, 'ampdu': ampdu, 'mcs': data[3:19].tobytes() }
+
+	##
+	# Returns the VHT capabilities as dictionary with the capability info
+	# and the supported MCS and NSS set.
+	def vht_capa(self):
+		data = self.get(WLAN_EID_VHT_CAPABILITY)
+		if data == None or len(data) < 12:
+			return None
+		info, rx_map, rx_highest, tx_map, tx_highest = _vht_capa.unpack_from(data, 0)
+		return { 'info': info, 'rx_mcs_map': rx_map, 'rx_highest': rx_highest,
+			 'tx_mcs_map': tx_map, 'tx_highest': tx_highest }
+
+	##
+	# Returns list of (OUI, type, payload) tuples for the vendor specific
+	# elements, optionally only the ones with given OUI. The OUI is given
+	# as 24-bit value and the payload is a memoryview.
+	def vendor(self, oui=None):
+		result = []
+		for data in self.get_all(WLAN_EID_VENDOR_SPECIFIC):
+			if len(data) < 4:
+				continue
+			voui = _suite.unpack_from(data, 0)[0] >> 8
+			if oui != None and voui != oui:
+				continue
+			result.append((voui, _u8.unpack_from(data, 3)[0], data[4:]))
+		return result
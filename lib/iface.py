@@ -28,12 +28,13 @@ import generated.defs as nl80211
 from generated.policy import nl80211_policy
 from base import *
 import factory
+import nlraw
 
 class interface(nl80211_managed_object):
 	_cmd = nl80211.CMD_GET_INTERFACE
-	def __init__(self, access, attrs):
-		nl80211_managed_object.__init__(self, access, attrs, nl80211_policy)
-		self._wdevid = nl.nla_get_u64(attrs[nl80211.ATTR_WDEV])
+	def __init__(self, access, attrs, proj=None):
+		nl80211_managed_object.__init__(self, access, attrs, nl80211_policy, proj)
+		self._wdevid = self.attrs[nl80211.ATTR_WDEV]
 
 	@property
 	def wdevid(self):
@@ -42,9 +43,26 @@ class interface(nl80211_managed_object):
 	def put_obj_id(self, msg):
 		nl.nla_put_u64(msg._msg, nl80211.ATTR_WDEV, self._wdevid)
 
+	def obj_key(self):
+		return self._wdevid
+
+##
+# Generator yielding an interface instance for each interface as soon
+# as it is received.
+def iter_interfaces(access=None, kind=nl.NL_CB_DEFAULT, only=None, exclude=None):
+	if access == None:
+		access = access80211(kind)
+	proj = make_projection(only, exclude, [ nl80211.ATTR_WDEV ])
+	flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
+	m = access.alloc_genlmsg(nl80211.CMD_GET_INTERFACE, flags)
+	for msg in access.dump_raw(m):
+		if nl80211.ATTR_WDEV in msg.attrs:
+			yield factory.get_inst().create(interface, access, msg.attrs, proj)
+
 class interface_list(custom_handler):
-	def __init__(self, access=None, kind=nl.NL_CB_DEFAULT):
+	def __init__(self, access=None, kind=nl.NL_CB_DEFAULT, only=None, exclude=None):
 		self._iface = {}
+		self._proj = make_projection(only, exclude, [ nl80211.ATTR_WDEV ])
 		if access == None:
 			access = access80211(kind)
 		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
@@ -63,10 +81,25 @@ class interface_list(custom_handler):
 				if wdevid in self._iface.keys():
 					self._iface[wdevid].store_attrs(attrs)
 				else:
-					iface = factory.get_inst().create(interface, self._access, attrs)
+					iface = factory.get_inst().create(interface, self._access, attrs, self._proj)
 					self._iface[iface.wdevid] = iface
 			return nl.NL_SKIP
 		except Exception as e:
 			(t,v,tb) = sys.exc_info()
 			print v.message
 			traceback.print_tb(tb)
+
+	def handle_raw(self, msg):
+		try:
+			attrs = msg.attrs
+			if nl80211.ATTR_WDEV in attrs:
+				wdevid = nlraw.get_u64(attrs[nl80211.ATTR_WDEV])
+				if wdevid in self._iface.keys():
+					self._iface[wdevid].store_attrs(attrs)
+				else:
+					iface = factory.get_inst().create(interface, self._access, attrs, self._proj)
+					self._iface[iface.wdevid] = iface
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
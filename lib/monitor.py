@@ -0,0 +1,221 @@
+##
+# Module providing a monitor for nl80211 multicast notifications.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import sys
+import traceback
+import select
+import socket
+import errno
+import time
+
+import generated.defs as nl80211
+
+from generated.policy import nl80211_policy
+from base import *
+from station import station_stats, stats_policy
+import factory
+import nlraw
+import ctrl
+
+MONITOR_GROUPS = [ 'config', 'scan', 'mlme', 'regulatory', 'vendor' ]
+
+MONITOR_RCVBUF = 1024 * 1024
+
+##
+# Notification received by the monitor. The attributes are decoded using
+# the nl80211 policy upon first access.
+class nl80211_event(nl80211_object):
+	nest_attr_map = {
+		nl80211.ATTR_STA_INFO: (station_stats, len(stats_policy), stats_policy)
+	}
+	def __init__(self, cmd, attrs):
+		nl80211_object.__init__(self, attrs, nl80211_policy)
+		self._cmd = cmd
+		self._raw_attrs = attrs
+
+	##
+	# Property (GET) for obtaining the nl80211 command of the notification.
+	@property
+	def cmd(self):
+		return self._cmd
+
+	##
+	# Property (GET) for obtaining the interface index or None if the
+	# notification is not related to an interface.
+	@property
+	def ifindex(self):
+		return self.attrs.get(nl80211.ATTR_IFINDEX)
+
+	##
+	# Property (GET) for obtaining the wiphy index or None.
+	@property
+	def wiphy(self):
+		return self.attrs.get(nl80211.ATTR_WIPHY)
+
+	##
+	# Property (GET) for obtaining the attributes as parsed by nlraw
+	# module, which can be used to create other nl80211_object instances.
+	@property
+	def raw_attrs(self):
+		return self._raw_attrs
+
+##
+# Long-lived monitor subscribing to the nl80211 multicast groups once.
+# Each notification is decoded into an nl80211_event instance which is
+# passed to the registered callbacks and put on the queue if one is
+# given. The monitor uses its own non-blocking socket so fileno() and
+# process() can be hooked up with an event loop. Otherwise run() can be
+# used to process notifications until stop() is called.
+#
+# All datagrams that can be received upon a wakeup are read before the
+# events are dispatched. When the socket buffer overruns notifications
+# are lost and the overrun callbacks are called so users can resync.
+class monitor(object):
+	def __init__(self, groups=MONITOR_GROUPS, queue=None):
+		self._callbacks = []
+		self._overrun_callbacks = []
+		self._queue = queue
+		self._running = False
+		self._sock = nlraw.open_socket()
+		self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MONITOR_RCVBUF)
+		self._sock.setblocking(0)
+		self._family = ctrl.resolve('nl80211')
+		if self._family < 0:
+			raise Exception("nl80211 family not found (%d)" % self._family)
+		self._groups = {}
+		for grp in groups:
+			mcid = ctrl.resolve_grp('nl80211', grp)
+			# not all groups are supported by older kernels.
+			if mcid < 0:
+				continue
+			nlraw.add_membership(self._sock, mcid)
+			self._groups[grp] = mcid
+
+	##
+	# Registers callback which is called with the nl80211_event instance
+	# for notifications with one of the given commands or for all
+	# notifications if no commands are given.
+	def add_callback(self, fn, cmds=None):
+		if cmds != None:
+			cmds = set(cmds)
+		self._callbacks.append((fn, cmds))
+
+	def remove_callback(self, fn):
+		self._callbacks = [ cb for cb in self._callbacks if cb[0] != fn ]
+
+	##
+	# Registers callback which is called without arguments when
+	# notifications were lost.
+	def add_overrun_callback(self, fn):
+		self._overrun_callbacks.append(fn)
+
+	def remove_overrun_callback(self, fn):
+		self._overrun_callbacks = [ cb for cb in self._overrun_callbacks if cb != fn ]
+
+	##
+	# Property (GET) for obtaining the multicast groups the monitor is
+	# subscribed to mapping group name to id.
+	@property
+	def groups(self):
+		return self._groups
+
+	@property
+	def queue(self):
+		return self._queue
+
+	def fileno(self):
+		return self._sock.fileno()
+
+	def _call(self, fn, *args):
+		try:
+			fn(*args)
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
+	def _dispatch(self, evt):
+		if self._queue != None:
+			self._queue.put(evt)
+		for fn, cmds in self._callbacks:
+			if cmds == None or evt.cmd in cmds:
+				self._call(fn, evt)
+
+	def _overrun(self):
+		for fn in self._overrun_callbacks:
+			self._call(fn)
+
+	##
+	# Receives all datagrams that are available without blocking and
+	# returns the list of events.
+	def _read(self):
+		events = []
+		while True:
+			try:
+				buf = nlraw.recv(self._sock, NL_RECV_SIZE)
+			except socket.error as e:
+				if e.errno in [ errno.EAGAIN, errno.EWOULDBLOCK ]:
+					return events
+				if e.errno == errno.ENOBUFS:
+					events.append(None)
+					continue
+				raise
+			for m in nlraw.iter_msgs(buf):
+				if m.type != self._family:
+					continue
+				events.append(factory.get_inst().create(nl80211_event, m.cmd, m.attrs))
+
+	##
+	# Processes all notifications that can be received without blocking
+	# and returns the number of events dispatched.
+	def process(self):
+		count = 0
+		for evt in self._read():
+			if evt == None:
+				self._overrun()
+				continue
+			self._dispatch(evt)
+			count += 1
+		return count
+
+	##
+	# Processes notifications until stop() is called or the timeout (in
+	# seconds) expires.
+	def run(self, timeout=None):
+		if timeout != None:
+			deadline = time.time() + timeout
+		poller = select.poll()
+		poller.register(self.fileno(), select.POLLIN)
+		self._running = True
+		while self._running:
+			if timeout == None:
+				# wake up regularly to notice stop().
+				poller.poll(1000)
+			else:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					break
+				poller.poll(min(remaining, 1.0) * 1000)
+			self.process()
+		self._running = False
+
+	def stop(self):
+		self._running = False
+
+	def close(self):
+		self._sock.close()
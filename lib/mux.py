@@ -0,0 +1,253 @@
+##
+# Module providing access to nl80211 with multiple requests in flight
+# over a single netlink socket.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import sys
+import traceback
+import select
+import socket
+import errno
+import time
+from collections import deque
+
+import netlink.capi as nl
+
+from base import *
+import nlraw
+
+##
+# Request sent using access80211_mux. It is completed when the kernel
+# signals the end of the response(s) and behaves like a future, ie. the
+# caller can check done() or add callbacks which are called upon
+# completion with the request as argument.
+class request(object):
+	def __init__(self, seq, handler):
+		self._seq = seq
+		self._handler = handler
+		self._error = None
+		self._callbacks = []
+
+	def done(self):
+		return self._error != None
+
+	def add_done_callback(self, fn):
+		if self.done():
+			fn(self)
+		else:
+			self._callbacks.append(fn)
+
+	def complete(self, error):
+		self._error = error
+		callbacks = self._callbacks
+		self._callbacks = []
+		for fn in callbacks:
+			fn(self)
+
+	##
+	# Property (GET) for obtaining the result of the request, which is 0
+	# or a negative error value like access80211.send() returns.
+	@property
+	def error(self):
+		return self._error
+
+	@property
+	def seq(self):
+		return self._seq
+
+	@property
+	def handler(self):
+		return self._handler
+
+##
+# Handler collecting the response messages of access80211_mux.dump_raw().
+# The messages are dropped once msgs is set to None.
+class _dump_collector(custom_handler):
+	def __init__(self, msgs):
+		self.msgs = msgs
+
+	def handle(self, msg, arg):
+		return nl.NL_SKIP
+
+	def handle_raw(self, msg):
+		if self.msgs != None:
+			self.msgs.append(msg)
+
+##
+# Access class which does not wait for the response when sending a
+# message. Instead send() returns a request instance and the responses
+# are matched to the request by sequence number. The socket is
+# non-blocking so fileno() and process() can be used to hook it up with
+# an event loop. Otherwise wait() can be used to process responses until
+# the requests are completed.
+#
+# The list classes, eg. station_list or bss_cache, can be given an
+# access80211_mux instance in which case they return immediately and get
+# filled when the responses are processed. Their refresh() returns the
+# request and entries no longer reported are removed when it completes.
+#
+# The responses are received on the raw socket of access80211, which is
+# non-blocking and not used by libnl for receiving. The dump_raw() of this
+# class receives using process() as well so functions taking the raw
+# dump, eg. bss_list.find_status_bss(), do not swallow the responses to
+# other pending requests.
+class access80211_mux(access80211):
+	def __init__(self, level=nl.NL_CB_DEFAULT):
+		access80211.__init__(self, level, raw=True)
+		self._pending = {}
+		self._notify = None
+
+	##
+	# Send netlink message to the kernel without waiting for the response.
+	# The provided handler will be called for each response message using
+	# handle_raw(). The timeout is not used here, see wait().
+	def send(self, msg, handler, timeout=None):
+		if not isinstance(handler, custom_handler):
+			raise Exception("provided 'handler' is not a custom_handler instance")
+		err = self._send_rawnl(msg)
+		req = request(nl.nlmsg_hdr(msg._msg).nlmsg_seq, handler)
+		if err < 0:
+			req.complete(err)
+		else:
+			self._pending[req.seq] = req
+		return req
+
+	def send_raw(self, msg, handler, timeout=None):
+		return self.send(msg, handler)
+
+	##
+	# Same as access80211.dump_raw() but the responses are received using
+	# process() so the responses to other pending requests are passed to
+	# their handlers meanwhile. When the caller stops early the remaining
+	# responses of the dump are dropped as they are received. When the
+	# timeout expires the request is completed with -ETIMEDOUT and
+	# AccessTimeoutError is raised.
+	def dump_raw(self, msg, timeout=None):
+		msgs = deque()
+		collector = _dump_collector(msgs)
+		req = self.send(msg, collector)
+		deadline = self._deadline(timeout)
+		try:
+			while True:
+				while len(msgs) > 0:
+					yield msgs.popleft()
+				if req.done():
+					self.busy = req.error
+					return
+				try:
+					self._wait_readable(deadline, True)
+				except Exception:
+					self._expire([ req ])
+					raise
+				self.process()
+		finally:
+			collector.msgs = None
+
+	##
+	# The responses are received by process() and matched with the pending
+	# requests. Receiving them here would drop the responses to the other
+	# requests.
+	def recv_raw(self, seq, deadline=None):
+		raise Exception('access80211_mux receives responses using process()')
+
+	def fileno(self):
+		return self.rawsock.fileno()
+
+	##
+	# Sets the handler of which handle_raw() is called for the multicast
+	# notifications received on the socket, eg. after subscribing with
+	# subscribe_multicast(). Without handler notifications are dropped.
+	def set_notify_handler(self, handler):
+		self._notify = handler
+
+	##
+	# Property (GET) for obtaining the requests that are not completed.
+	@property
+	def pending(self):
+		return self._pending.values()
+
+	def _dispatch(self, m):
+		req = self._pending.get(m.seq)
+		if req == None:
+			if m.seq == 0 and m.cmd != None and self._notify != None:
+				self._call(self._notify.handle_raw, m)
+			return
+		if m.type == nlraw.NLMSG_DONE:
+			del self._pending[m.seq]
+			req.complete(0)
+		elif m.type == nlraw.NLMSG_ERROR:
+			del self._pending[m.seq]
+			req.complete(m.error)
+		elif m.type != nlraw.NLMSG_NOOP:
+			self._call(req.handler.handle_raw, m)
+
+	def _call(self, fn, *args):
+		try:
+			fn(*args)
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
+	##
+	# Processes all messages that can be received without blocking and
+	# returns the number of messages processed.
+	def process(self):
+		count = 0
+		while True:
+			try:
+				buf = nlraw.recv(self.rawsock, NL_RECV_SIZE)
+			except socket.error as e:
+				if e.errno in [ errno.EAGAIN, errno.EWOULDBLOCK ]:
+					return count
+				raise
+			for m in nlraw.iter_msgs(buf):
+				self._dispatch(m)
+				count += 1
+
+	def _expire(self, reqs):
+		for req in reqs:
+			if not req.done():
+				self._pending.pop(req.seq, None)
+				req.complete(-errno.ETIMEDOUT)
+
+	##
+	# Processes responses until the given requests, or all pending
+	# requests if none are given, are completed. Returns False if the
+	# timeout (in seconds) expired before that, in which case the requests
+	# that are not completed are dropped and completed with -ETIMEDOUT.
+	# Late responses to these requests are ignored.
+	def wait(self, reqs=None, timeout=None):
+		if reqs == None:
+			reqs = self.pending
+		elif isinstance(reqs, request):
+			reqs = [ reqs ]
+		if timeout != None:
+			deadline = time.time() + timeout
+		poller = select.poll()
+		poller.register(self.fileno(), select.POLLIN)
+		while not all([ r.done() for r in reqs ]):
+			if timeout == None:
+				poller.poll()
+			else:
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					self._expire(reqs)
+					return False
+				poller.poll(remaining * 1000)
+			self.process()
+		return True
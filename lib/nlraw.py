@@ -0,0 +1,208 @@
+##
+# Module providing pure-Python parsing of netlink messages and attributes.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import struct
+import socket
+
+NLMSG_HDRLEN = 16
+GENL_HDRLEN = 4
+NLA_HDRLEN = 4
+
+NLMSG_NOOP = 1
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLMSG_OVERRUN = 4
+
+NLM_F_REQUEST = 1
+NLM_F_MULTI = 2
+NLM_F_ACK = 4
+NLM_F_DUMP = 0x300
+
+NETLINK_GENERIC = 16
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+NETLINK_DROP_MEMBERSHIP = 2
+
+NLA_F_NESTED = 1 << 15
+NLA_F_NET_BYTEORDER = 1 << 14
+NLA_TYPE_MASK = ~(NLA_F_NESTED | NLA_F_NET_BYTEORDER) & 0xffff
+
+_nlmsghdr = struct.Struct('=IHHII')
+_genlmsghdr = struct.Struct('=BBH')
+_nlattr = struct.Struct('=HH')
+_errno = struct.Struct('=i')
+_u8 = struct.Struct('=B')
+_u16 = struct.Struct('=H')
+_u32 = struct.Struct('=I')
+_u64 = struct.Struct('=Q')
+
+def nla_align(size):
+	return (size + 3) & ~3
+
+##
+# Attribute dictionary as created by parse_attrs(). It maps the attribute
+# id to a memoryview on the attribute payload so no data is copied until
+# the attribute is actually decoded.
+class raw_attrs(dict):
+	pass
+
+##
+# Walks the attribute stream in buf[offset:end] yielding the attribute id
+# and a memoryview on the attribute payload for each attribute.
+def iter_attrs(buf, offset=0, end=None):
+	if not isinstance(buf, memoryview):
+		buf = memoryview(buf)
+	if end == None:
+		end = len(buf)
+	while offset + NLA_HDRLEN <= end:
+		nla_len, nla_type = _nlattr.unpack_from(buf, offset)
+		if nla_len < NLA_HDRLEN or offset + nla_len > end:
+			break
+		yield nla_type & NLA_TYPE_MASK, buf[offset + NLA_HDRLEN:offset + nla_len]
+		offset += nla_align(nla_len)
+
+##
+# Parses the attribute stream in buf[offset:end] into a raw_attrs instance.
+# Similar to nla_parse() attributes with id beyond maxtype are ignored and
+# the last occurrence of an attribute id wins.
+def parse_attrs(buf, maxtype=None, offset=0, end=None):
+	attrs = raw_attrs()
+	for aid, data in iter_attrs(buf, offset, end):
+		if maxtype == None or aid <= maxtype:
+			attrs[aid] = data
+	return attrs
+
+def get_u8(data):
+	return _u8.unpack_from(data)[0]
+
+def get_u16(data):
+	return _u16.unpack_from(data)[0]
+
+def get_u32(data):
+	return _u32.unpack_from(data)[0]
+
+def get_u64(data):
+	return _u64.unpack_from(data)[0]
+
+##
+# Returns the NUL-terminated string in the attribute payload.
+def get_string(data):
+	return data.tobytes().split('\0', 1)[0]
+
+##
+# Returns a copy of the attribute payload as bytearray, which is what
+# nla_data() provides for the libnl path.
+def get_data(data):
+	return bytearray(data)
+
+##
+# Netlink message located in a receive buffer. For NLMSG_ERROR messages
+# the error attribute holds the (negative) errno value and for generic
+# netlink messages the cmd attribute and attrs property are valid.
+class genl_msg(object):
+	def __init__(self, buf, offset):
+		self._buf = buf
+		self._offset = offset
+		(self.len, self.type, self.flags,
+		 self.seq, self.pid) = _nlmsghdr.unpack_from(buf, offset)
+		self._attrs = None
+		if self.type == NLMSG_ERROR:
+			self.error = _errno.unpack_from(buf, offset + NLMSG_HDRLEN)[0]
+			self.cmd = None
+		elif self.type >= NLMSG_OVERRUN and self.len >= NLMSG_HDRLEN + GENL_HDRLEN:
+			self.error = 0
+			self.cmd, self.version, _ = _genlmsghdr.unpack_from(buf, offset + NLMSG_HDRLEN)
+		else:
+			self.error = 0
+			self.cmd = None
+
+	##
+	# Property (GET) for obtaining the generic netlink attributes. These
+	# are parsed upon first access.
+	@property
+	def attrs(self):
+		if self._attrs == None:
+			start = self._offset + NLMSG_HDRLEN + GENL_HDRLEN
+			self._attrs = parse_attrs(self._buf, None, start, self._offset + self.len)
+		return self._attrs
+
+	##
+	# Property (GET) for obtaining the complete message as memoryview.
+	@property
+	def data(self):
+		return self._buf[self._offset:self._offset + self.len]
+
+##
+# Walks the netlink messages in buf[0:size] as received from the socket
+# yielding a genl_msg instance for each of them.
+def iter_msgs(buf, size=None):
+	if not isinstance(buf, memoryview):
+		buf = memoryview(buf)
+	if size == None:
+		size = len(buf)
+	offset = 0
+	while offset + NLMSG_HDRLEN <= size:
+		msg = genl_msg(buf, offset)
+		if msg.len < NLMSG_HDRLEN or offset + msg.len > size:
+			break
+		yield msg
+		offset += nla_align(msg.len)
+
+##
+# Creates an attribute with the given payload including the padding.
+def nla_put(aid, payload):
+	size = NLA_HDRLEN + len(payload)
+	return _nlattr.pack(size, aid) + str(payload) + '\0' * (-size & 3)
+
+def nla_put_u32(aid, val):
+	return nla_put(aid, _u32.pack(val))
+
+def nla_put_u64(aid, val):
+	return nla_put(aid, _u64.pack(val))
+
+def nla_put_string(aid, val):
+	return nla_put(aid, val + '\0')
+
+##
+# Creates a generic netlink message with the given attribute payload.
+def build_genlmsg(family, flags, seq, cmd, payload='', version=1):
+	size = NLMSG_HDRLEN + GENL_HDRLEN + len(payload)
+	return _nlmsghdr.pack(size, family, flags, seq, 0) + \
+		_genlmsghdr.pack(cmd, version, 0) + payload
+
+##
+# Receives a datagram and returns a bytearray holding only the received
+# data. The messages and attributes parsed from it refer to that buffer
+# so a buffer of bufsize would be kept alive for each of them.
+def recv(sock, bufsize):
+	buf = bytearray(bufsize)
+	size = sock.recv_into(buf)
+	return buf[:size]
+
+##
+# Opens a netlink socket for use without libnl.
+def open_socket(protocol=NETLINK_GENERIC):
+	sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, protocol)
+	sock.bind((0, 0))
+	return sock
+
+def add_membership(sock, group):
+	sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
+
+def drop_membership(sock, group):
+	sock.setsockopt(SOL_NETLINK, NETLINK_DROP_MEMBERSHIP, group)
@@ -0,0 +1,230 @@
+##
+# Module providing parallel polling of all wireless interfaces.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import sys
+import traceback
+import threading
+import struct
+import time
+import Queue
+
+import netlink.capi as nl
+import generated.defs as nl80211
+
+from base import *
+import factory
+import nlraw
+from pool import access80211_pool
+from iface import interface, interface_list
+from station import station_list
+from scan import bss_list
+
+##
+# Default time in seconds each request of interface_poller waits for its
+# response.
+POLLER_REQUEST_TIMEOUT = 5.0
+
+##
+# Result of polling a single interface. The stations and bss attributes
+# hold the station_list and bss_list respectively or None if not polled.
+# The latency is the time in seconds it took to poll the interface and
+# error holds the error message if polling failed or timed out.
+class poll_result(object):
+	def __init__(self, iface):
+		self.iface = iface
+		self.ifindex = iface.attrs.get(nl80211.ATTR_IFINDEX)
+		self.ifname = iface.attrs.get(nl80211.ATTR_IFNAME)
+		self.stations = None
+		self.bss = None
+		self.latency = None
+		self.error = None
+
+##
+# Merged result of polling all interfaces.
+class snapshot(object):
+	def __init__(self, results, timestamp, duration):
+		self._results = results
+		self._timestamp = timestamp
+		self._duration = duration
+
+	def __iter__(self):
+		return iter(self._results)
+
+	##
+	# Property (GET) for obtaining the time at which the poll started.
+	@property
+	def timestamp(self):
+		return self._timestamp
+
+	##
+	# Property (GET) for obtaining the time in seconds the poll took.
+	@property
+	def duration(self):
+		return self._duration
+
+	##
+	# Returns dictionary mapping the interface name to the latency.
+	def latency(self):
+		return dict([ (r.ifname, r.latency) for r in self._results ])
+
+	##
+	# Returns list of (interface name, station) tuples for all polled
+	# interfaces.
+	def stations(self):
+		result = []
+		for r in self._results:
+			if r.stations != None:
+				result += [ (r.ifname, sta) for sta in r.stations ]
+		return result
+
+	##
+	# Returns list of (interface name, bss) tuples for all polled
+	# interfaces.
+	def bss(self):
+		result = []
+		for r in self._results:
+			if r.bss != None:
+				result += [ (r.ifname, b) for b in r.bss ]
+		return result
+
+	##
+	# Returns the results of the interfaces that failed or timed out.
+	def errors(self):
+		return [ r for r in self._results if r.error != None ]
+
+##
+# Collector polling all interfaces obtained with interface_list in
+# parallel. Each worker thread uses its own nl80211 socket from an
+# access80211_pool so a slow response for one interface does not delay
+# the other interfaces. Interfaces without netdev, eg. P2P device, are
+# only refreshed. The request_timeout limits the time (in seconds) each
+# request waits for its response so a worker does not hang forever.
+class interface_poller(object):
+	def __init__(self, workers=4, stations=True, scan=True, kind=nl.NL_CB_DEFAULT,
+		     request_timeout=POLLER_REQUEST_TIMEOUT):
+		self._workers = workers
+		self._stations = stations
+		self._scan = scan
+		self._pool = access80211_pool(workers, kind, timeout=request_timeout)
+
+	##
+	# Points the object to the pool instead of the pooled connection it
+	# was created with, which is used by another worker once checked in.
+	def _use_pool(self, obj):
+		obj._access = self._pool
+
+	##
+	# Polls the interface into a new poll_result. The interface is
+	# refreshed in a copy so the interface of the listing is never
+	# modified by a worker. No further requests are sent once the poll
+	# is over.
+	def _poll_iface(self, access, listed, poll):
+		res = poll_result(listed)
+		start = time.time()
+		try:
+			attrs = nlraw.raw_attrs()
+			attrs[nl80211.ATTR_WDEV] = memoryview(bytearray(struct.pack('=Q', listed.wdevid)))
+			iface = factory.get_inst().create(interface, access, attrs)
+			try:
+				iface.refresh()
+			finally:
+				self._use_pool(iface)
+			res.iface = iface
+			if res.ifindex != None:
+				if self._stations and not poll['done']:
+					res.stations = station_list(res.ifindex, access)
+					self._use_pool(res.stations)
+					for sta in res.stations:
+						self._use_pool(sta)
+				if self._scan and not poll['done']:
+					res.bss = bss_list(res.ifindex, access=access)
+					self._use_pool(res.bss)
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			res.error = v.message
+			traceback.print_tb(tb)
+		res.latency = time.time() - start
+		return res
+
+	##
+	# Worker taking (index, interface) tasks. Each result is stored in the
+	# slot of its interface unless the poll is already over, in which case
+	# it is discarded. The access in use is kept in active so the poll can
+	# cancel it when the timeout expires.
+	def _worker(self, tasks, poll):
+		while True:
+			try:
+				idx, iface = tasks.get_nowait()
+			except Queue.Empty:
+				return
+			with self._pool.connection() as access:
+				with poll['lock']:
+					if poll['done']:
+						return
+					poll['active'][idx] = access
+				try:
+					res = self._poll_iface(access, iface, poll)
+				finally:
+					with poll['lock']:
+						del poll['active'][idx]
+						if not poll['done']:
+							poll['results'][idx] = res
+
+	##
+	# Polls all interfaces and returns a snapshot instance. Interfaces
+	# that are not done within the timeout (in seconds) are marked with
+	# a timeout error. Their requests are cancelled and their results are
+	# discarded so the snapshot does not change once returned. The timeout
+	# includes obtaining the interfaces, for which PoolEmptyError is
+	# raised if no connection becomes available in time.
+	def poll(self, timeout=None):
+		start = time.time()
+		with self._pool.connection(timeout) as access:
+			ifaces = [ iface for iface in interface_list(access) ]
+		for iface in ifaces:
+			iface._access = self._pool
+		poll = {
+			'lock': threading.Lock(),
+			'done': False,
+			'active': {},
+			'results': [ None ] * len(ifaces)
+		}
+		tasks = Queue.Queue()
+		for task in enumerate(ifaces):
+			tasks.put(task)
+		threads = []
+		for i in range(min(self._workers, len(ifaces))):
+			thread = threading.Thread(target=self._worker, args=(tasks, poll))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		for thread in threads:
+			if timeout == None:
+				thread.join()
+			else:
+				thread.join(max(0, start + timeout - time.time()))
+		with poll['lock']:
+			poll['done'] = True
+			for access in poll['active'].values():
+				access.cancel()
+			results = poll['results']
+		for idx in range(len(results)):
+			if results[idx] == None:
+				results[idx] = poll_result(ifaces[idx])
+				results[idx].error = 'timeout'
+		return snapshot(results, start, time.time() - start)
@@ -0,0 +1,130 @@
+##
+# Module providing a pool of nl80211 connections to be shared by
+# multiple threads.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import Queue
+from contextlib import contextmanager
+
+import netlink.capi as nl
+import netlink.core as nlc
+import netlink.genl.capi as genl
+
+from base import *
+
+##
+# Exception which is raised when no connection could be checked out
+# from the pool within the given timeout.
+class PoolEmptyError(Exception):
+	pass
+
+##
+# Pool of access80211 instances. The nl80211 family is only resolved
+# once for the whole pool. Each connection has its own socket and
+# callbacks so threads using different connections do not interfere.
+#
+# Apart from checkout() and checkin() the pool provides the same
+# alloc_genlmsg() and send() as access80211 so it can be passed as
+# access to station_list, interface_list, bss_list and wiphy_list, which
+# allows polling many interfaces in parallel from multiple threads. Each
+# send() uses a connection from the pool for the duration of the
+# transaction.
+#
+# The timeout is the default timeout (in seconds) of the connections for
+# receiving a response (see access80211).
+class access80211_pool(object):
+	def __init__(self, size=4, level=nl.NL_CB_DEFAULT, raw=False, timeout=None):
+		if size < 1:
+			raise Exception("pool size must be at least 1")
+		first = access80211(level, raw, timeout=timeout)
+		self._family = first.family
+		self._size = size
+		self._idle = Queue.Queue()
+		self._idle.put(first)
+		for i in range(size - 1):
+			self._idle.put(access80211(level, raw, self._family, timeout))
+
+	##
+	# Obtains a connection from the pool waiting for one to become
+	# available if needed.
+	def checkout(self, timeout=None):
+		try:
+			return self._idle.get(True, timeout)
+		except Queue.Empty:
+			raise PoolEmptyError()
+
+	##
+	# Returns a connection to the pool.
+	def checkin(self, access):
+		access.reset()
+		self._idle.put(access)
+
+	##
+	# Context manager for using a connection from the pool, eg.:
+	#
+	#	with pool.connection() as access:
+	#		sl = station_list(ifidx, access)
+	@contextmanager
+	def connection(self, timeout=None):
+		access = self.checkout(timeout)
+		try:
+			yield access
+		finally:
+			self.checkin(access)
+
+	##
+	# Allocates a netlink message setup with genl header for nl80211 family.
+	def alloc_genlmsg(self, cmd, flags=0):
+		msg = nlc.Message()
+		genl.genlmsg_put(msg._msg, 0, 0, self._family, 0, flags, cmd, 0)
+		return msg
+
+	##
+	# Same as access80211.genlmsg_template() except that the message is
+	# built every time as the threads using the pool could otherwise send
+	# the same message instance at the same time.
+	def genlmsg_template(self, cmd, flags, key, put):
+		msg = self.alloc_genlmsg(cmd, flags)
+		put(msg)
+		return msg
+
+	##
+	# Send netlink message using a connection from the pool and wait for
+	# the response.
+	def send(self, msg, handler, timeout=None):
+		with self.connection() as access:
+			return access.send(msg, handler, timeout)
+
+	##
+	# Same as access80211.dump_raw() using a connection from the pool
+	# until the generator is exhausted or closed.
+	def dump_raw(self, msg, timeout=None):
+		with self.connection() as access:
+			for m in access.dump_raw(msg, timeout):
+				yield m
+
+	##
+	# Property (GET) for obtaining the generic netlink family.
+	@property
+	def family(self):
+		return self._family
+
+	##
+	# Property (GET) for obtaining the number of connections in the pool.
+	@property
+	def size(self):
+		return self._size
@@ -0,0 +1,199 @@
+##
+# Module providing time-series sampling of station statistics.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import time
+
+import numpy as np
+import netlink.capi as nl
+import generated.defs as nl80211
+
+from base import *
+from station import station_list, mac_key
+
+##
+# Fields sampled for each station specified by name, STA_INFO attribute
+# and whether it is a counter for which deltas are meaningful. For the
+# bitrates the RATE_INFO attribute in the nested attribute is given.
+sampler_fields = [
+	('rx_bytes', nl80211.STA_INFO_RX_BYTES64, None, True),
+	('tx_bytes', nl80211.STA_INFO_TX_BYTES64, None, True),
+	('tx_retries', nl80211.STA_INFO_TX_RETRIES, None, True),
+	('tx_failed', nl80211.STA_INFO_TX_FAILED, None, True),
+	('signal', nl80211.STA_INFO_SIGNAL, None, False),
+	('signal_avg', nl80211.STA_INFO_SIGNAL_AVG, None, False),
+	('tx_bitrate', nl80211.STA_INFO_TX_BITRATE, nl80211.RATE_INFO_BITRATE32, False),
+	('rx_bitrate', nl80211.STA_INFO_RX_BITRATE, nl80211.RATE_INFO_BITRATE32, False)
+]
+
+sampler_counters = set([ name for name, aid, rate_aid, counter in sampler_fields if counter ])
+
+##
+# Samples the statistics of the stations on an interface at a fixed
+# interval into preallocated ring buffers holding depth samples. Each
+# field is stored in a 2-dimensional array with a row per station and a
+# column per sample. Missing values are NaN. The station_list is dumped
+# with a projection so only the sampled attributes are decoded.
+#
+# The bitrates are in units of 100 kbps as provided by nl80211.
+class station_sampler(object):
+	def __init__(self, ifidx, interval=1.0, depth=300, max_stations=64,
+		     access=None, kind=nl.NL_CB_DEFAULT):
+		self._interval = interval
+		self._depth = depth
+		self._count = 0
+		self._running = False
+		self._rows = {}
+		self._macs = {}
+		self._free = range(max_stations)
+		self._time = np.zeros(depth)
+		self._data = {}
+		for name, aid, rate_aid, counter in sampler_fields:
+			self._data[name] = np.empty((max_stations, depth))
+			self._data[name].fill(np.nan)
+		stats = [ aid for name, aid, rate_aid, counter in sampler_fields ]
+		only = { nl80211.ATTR_MAC: None, nl80211.ATTR_STA_INFO: stats }
+		self._list = station_list(ifidx, access, kind, only=only)
+
+	##
+	# Doubles the number of station rows in the ring buffers.
+	def _grow(self):
+		rows = len(self._data['signal'])
+		for name in self._data.keys():
+			extra = np.empty((rows, self._depth))
+			extra.fill(np.nan)
+			self._data[name] = np.concatenate((self._data[name], extra))
+		self._free += range(rows, 2 * rows)
+
+	def _row(self, key):
+		if not key in self._rows:
+			if len(self._free) == 0:
+				self._grow()
+			row = self._free.pop(0)
+			self._rows[key] = row
+		return self._rows[key]
+
+	def _release(self, key):
+		row = self._rows.pop(key)
+		self._macs.pop(key, None)
+		for name in self._data.keys():
+			self._data[name][row].fill(np.nan)
+		self._free.append(row)
+
+	##
+	# Dumps the stations and stores their statistics in the next column
+	# of the ring buffers. Returns the number of stations sampled.
+	def sample(self, now=None):
+		self._list.refresh()
+		if now == None:
+			now = time.time()
+		col = self._count % self._depth
+		self._time[col] = now
+		for name in self._data.keys():
+			self._data[name][:, col] = np.nan
+		present = set()
+		for sta in self._list:
+			key = mac_key(sta.mac)
+			present.add(key)
+			row = self._row(key)
+			self._macs[key] = sta.mac
+			if not nl80211.ATTR_STA_INFO in sta.attrs:
+				continue
+			stats = sta.attrs[nl80211.ATTR_STA_INFO].attrs
+			for name, aid, rate_aid, counter in sampler_fields:
+				if not aid in stats:
+					continue
+				val = stats[aid]
+				if rate_aid != None:
+					val = val.attrs.get(rate_aid, val.attrs.get(nl80211.RATE_INFO_BITRATE))
+					if val == None:
+						continue
+				self._data[name][row, col] = val
+		for key in self._rows.keys():
+			if not key in present:
+				self._release(key)
+		self._count += 1
+		return len(present)
+
+	##
+	# Samples at the fixed interval until stop() is called or the given
+	# number of samples is taken.
+	def run(self, count=None):
+		self._running = True
+		deadline = time.time()
+		while self._running and count != 0:
+			self.sample()
+			if count != None:
+				count -= 1
+			deadline += self._interval
+			delay = deadline - time.time()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				# sampling takes longer than the interval.
+				deadline = time.time()
+		self._running = False
+
+	def stop(self):
+		self._running = False
+
+	##
+	# Returns the column indices of the samples in chronological order.
+	def _order(self):
+		if self._count <= self._depth:
+			return np.arange(self._count)
+		start = self._count % self._depth
+		return (np.arange(self._depth) + start) % self._depth
+
+	##
+	# Returns the row of the station with given MAC address in the arrays
+	# returned by series(), deltas() and rates() or None.
+	def row(self, mac):
+		return self._rows.get(mac_key(mac))
+
+	##
+	# Returns dictionary mapping the row to the MAC address of the
+	# stations currently sampled.
+	def stations(self):
+		return dict([ (self._rows[key], self._macs[key]) for key in self._rows.keys() ])
+
+	##
+	# Returns the sample times in chronological order.
+	def times(self):
+		return self._time[self._order()]
+
+	##
+	# Returns array with a row per station holding the samples of the
+	# given field in chronological order.
+	def series(self, name):
+		return self._data[name][:, self._order()]
+
+	##
+	# Returns the per-interval differences of the given field. For the
+	# counter fields negative differences, ie. counter wrap or reset, are
+	# NaN.
+	def deltas(self, name):
+		d = np.diff(self.series(name), axis=1)
+		if name in sampler_counters:
+			with np.errstate(invalid='ignore'):
+				d[d < 0] = np.nan
+		return d
+
+	##
+	# Returns the per-second rates of the given counter field.
+	def rates(self, name):
+		return self.deltas(name) / np.diff(self.times())
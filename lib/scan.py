@@ -18,6 +18,10 @@
 #
 import sys
 import traceback
+import select
+import errno
+import time
+from collections import deque
 
 import netlink.capi as nl
 import netlink.core as nlc
@@ -27,6 +31,9 @@ import generated.defs as nl80211
 from generated.policy import nl80211_policy
 from base import *
 import factory
+import nlraw
+import ie
+import mux
 
 bss_policy = nl.nla_policy_array(nl80211.BSS_MAX + 1)
 bss_policy[nl80211.BSS_TSF].type = nl.NLA_U64
@@ -45,31 +52,284 @@ bss_policy[nl80211.BSS_BEACON_TSF].type = nl.NLA_U64
 bss_policy[nl80211.BSS_CHAN_WIDTH].type = nl.NLA_U32
 bss_policy[nl80211.BSS_PRESP_DATA].type = nl.NLA_FLAG
 
+compile_policy(bss_policy)
+
 class bss(nl80211_object):
-	pass
+	_ies = None
+	_beacon_ies = None
+
+	##
+	# Returns the ie_index for the given attribute building it upon first
+	# use or when the attribute was updated.
+	def _ie_index(self, aid, cached):
+		if not aid in self.attrs:
+			return None
+		data = self.attrs[aid]
+		if cached == None or not cached._data is data:
+			cached = ie.ie_index(data)
+		return cached
+
+	##
+	# Property (GET) for obtaining the ie_index on the information
+	# elements of the BSS or None if there are none.
+	@property
+	def ies(self):
+		self._ies = self._ie_index(nl80211.BSS_INFORMATION_ELEMENTS, self._ies)
+		return self._ies
+
+	##
+	# Property (GET) for obtaining the ie_index on the information
+	# elements of the last beacon or None if there are none.
+	@property
+	def beacon_ies(self):
+		self._beacon_ies = self._ie_index(nl80211.BSS_BEACON_IES, self._beacon_ies)
+		return self._beacon_ies
+
+##
+# Generator yielding the raw BSS attributes from a CMD_GET_SCAN dump.
+def _bss_dump(ifidx, access):
+	flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
+	m = access.genlmsg_template(nl80211.CMD_GET_SCAN, flags, ifidx,
+		lambda m: nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, ifidx))
+	for msg in access.dump_raw(m):
+		attrs = msg.attrs
+		if nl80211.ATTR_BSS in attrs:
+			yield nlraw.parse_attrs(attrs[nl80211.ATTR_BSS], len(bss_policy))
+
+##
+# Generator yielding a bss instance for each scan result as soon as it
+# is received. The caller may stop early without the remaining results
+# being decoded.
+def iter_bss(ifidx, access=None, kind=nl.NL_CB_DEFAULT, only=None, exclude=None):
+	if access == None:
+		access = access80211(kind)
+	proj = make_projection(only, exclude)
+	for nattrs in _bss_dump(ifidx, access):
+		yield factory.get_inst().create(bss, nattrs, bss_policy, proj)
+
+##
+# Columns of the structured array created by bss_array() and
+# bss_list.to_array() specified by name, attribute id, numpy type and
+# size of the attribute payload. Missing attributes are zero.
+bss_columns = [
+	('bssid', nl80211.BSS_BSSID, 'u1', 6),
+	('frequency', nl80211.BSS_FREQUENCY, '=u4', 4),
+	('signal_mbm', nl80211.BSS_SIGNAL_MBM, '=i4', 4),
+	('chan_width', nl80211.BSS_CHAN_WIDTH, '=u4', 4),
+	('beacon_interval', nl80211.BSS_BEACON_INTERVAL, '=u2', 2),
+	('tsf', nl80211.BSS_TSF, '=u8', 8),
+	('seen_ms_ago', nl80211.BSS_SEEN_MS_AGO, '=u4', 4)
+]
+
+##
+# Returns numpy data type for the bss_columns. The numpy module is only
+# imported when needed as it is not required otherwise.
+def bss_dtype():
+	import numpy as np
+	dtype = []
+	for name, aid, coltype, size in bss_columns:
+		if name == 'bssid':
+			dtype.append((name, coltype, (size,)))
+		else:
+			dtype.append((name, coltype))
+	return np.dtype(dtype)
+
+##
+# Creates structured array from the raw BSS attributes. Each column is
+# created from the concatenated attribute payloads at once.
+def _raw_bss_array(rows):
+	import numpy as np
+	arr = np.zeros(len(rows), dtype=bss_dtype())
+	if len(rows) == 0:
+		return arr
+	for name, aid, coltype, size in bss_columns:
+		zero = '\0' * size
+		chunks = []
+		for nattrs in rows:
+			data = nattrs.get(aid)
+			if data == None or len(data) != size:
+				chunks.append(zero)
+			else:
+				chunks.append(data.tobytes())
+		col = np.frombuffer(''.join(chunks), dtype=coltype)
+		if name == 'bssid':
+			col = col.reshape(len(rows), size)
+		arr[name] = col
+	return arr
 
+##
+# Dumps the scan results of the interface into a numpy structured array
+# with the bss_columns. The array is filled from the raw attributes so no
+# bss instances are created.
+def bss_array(ifidx, access=None, kind=nl.NL_CB_DEFAULT):
+	if access == None:
+		access = access80211(kind)
+	return _raw_bss_array(list(_bss_dump(ifidx, access)))
+
+##
+# List of scan results on an interface. The only and exclude arguments
+# specify a projection on the BSS attributes limiting the attributes that
+# are decoded (see base.projection).
 class bss_list(custom_handler):
-	def __init__(self, ifidx, kind=nl.NL_CB_DEFAULT):
-		self._access = access80211(kind)
+	def __init__(self, ifidx, kind=nl.NL_CB_DEFAULT, access=None, only=None, exclude=None):
+		if access == None:
+			access = access80211(kind)
+		self._access = access
+		self._proj = make_projection(only, exclude)
 		self._ifidx = ifidx
 		self.refresh()
 
 	def __iter__(self):
 		return iter(self._bss)
 
+	def __len__(self):
+		return len(self._bss)
+
+	##
+	# Returns numpy structured array with the bss_columns for the scan
+	# results in the list.
+	def to_array(self):
+		import numpy as np
+		arr = np.zeros(len(self._bss), dtype=bss_dtype())
+		if len(self._bss) == 0:
+			return arr
+		for name, aid, coltype, size in bss_columns:
+			if name == 'bssid':
+				data = ''.join([ str(b.attrs.get(aid, '\0' * size)) for b in self._bss ])
+				arr[name] = np.frombuffer(data, dtype=coltype).reshape(len(self._bss), size)
+			else:
+				arr[name] = [ b.attrs.get(aid, 0) for b in self._bss ]
+		return arr
+
+	##
+	# Returns the BSS with status attribute, ie. the one we are associated
+	# or joined with. The dump is stopped once it is found and the other
+	# results are not decoded.
 	def find_status_bss(self):
-		self.refresh()
-		for bss in self._bss:
-			if nl80211.BSS_STATUS in bss.attrs:
-				return bss
+		for nattrs in _bss_dump(self._ifidx, self._access):
+			if nl80211.BSS_STATUS in nattrs:
+				return factory.get_inst().create(bss, nattrs, bss_policy, self._proj)
 		return None
 
 	def refresh(self):
 		self._bss = []
 		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
-		m = self._access.alloc_genlmsg(nl80211.CMD_GET_SCAN, flags)
-		nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, self._ifidx)
-		self._access.send(m, self)
+		m = self._access.genlmsg_template(nl80211.CMD_GET_SCAN, flags, self._ifidx,
+			lambda m: nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, self._ifidx))
+		return self._access.send(m, self)
+
+	def handle(self, msg, arg):
+		try:
+			e, attrs = genl.py_genlmsg_parse(nl.nlmsg_hdr(msg), 0, nl80211.ATTR_MAX, None)
+			if not nl80211.ATTR_BSS in attrs:
+				return
+			e, nattrs = nl.py_nla_parse_nested(len(bss_policy), attrs[nl80211.ATTR_BSS], bss_policy)
+			self._bss.append(factory.get_inst().create(bss, nattrs, bss_policy, self._proj))
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+		return nl.NL_SKIP
+
+	def handle_raw(self, msg):
+		try:
+			attrs = msg.attrs
+			if not nl80211.ATTR_BSS in attrs:
+				return
+			nattrs = nlraw.parse_attrs(attrs[nl80211.ATTR_BSS], len(bss_policy))
+			self._bss.append(factory.get_inst().create(bss, nattrs, bss_policy, self._proj))
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
+##
+# Returns the key of a BSS in the bss_cache, which is the tuple of BSSID
+# and frequency.
+def bss_key(bssid, freq):
+	return (str(bssid), freq)
+
+##
+# Cache of scan results on an interface keyed by BSSID and frequency. On
+# refresh() only the entries of which the TSF, signal or IE payload has
+# changed are decoded again. The comparison is done on the raw attribute
+# payload. The added, changed and removed properties provide the keys
+# (see bss_key()) affected by the last refresh.
+#
+# The BSS_SEEN_MS_AGO attribute is relative to the time of the dump so it
+# differs on nearly every refresh. It is updated in the cached entry but
+# does not mark the entry as changed, which the TSF already does when a
+# new frame was received.
+class bss_cache(custom_handler):
+	compare_attrs = [
+		nl80211.BSS_TSF,
+		nl80211.BSS_SIGNAL_MBM,
+		nl80211.BSS_SIGNAL_UNSPEC,
+		nl80211.BSS_INFORMATION_ELEMENTS,
+		nl80211.BSS_BEACON_IES
+	]
+	def __init__(self, ifidx, kind=nl.NL_CB_DEFAULT, access=None, only=None, exclude=None):
+		if access == None:
+			access = access80211(kind)
+		self._access = access
+		self._proj = make_projection(only, exclude)
+		self._ifidx = ifidx
+		self._bss = {}
+		self._fingerprint = {}
+		self._seen = None
+		self.refresh()
+
+	##
+	# Dumps the scan results updating the cache. Returns the result of the
+	# send() method of the access instance. With access80211_mux that is
+	# the request and the removed entries are determined when it
+	# completes.
+	def refresh(self):
+		self._added = set()
+		self._changed = set()
+		self._removed = set()
+		self._seen = set()
+		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
+		m = self._access.genlmsg_template(nl80211.CMD_GET_SCAN, flags, self._ifidx,
+			lambda m: nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, self._ifidx))
+		ret = self._access.send(m, self)
+		if isinstance(ret, mux.request):
+			ret.add_done_callback(lambda req: self._remove_unseen(req.error))
+		else:
+			self._remove_unseen(ret)
+		return ret
+
+	##
+	# Removes the entries not reported by the completed dump. Nothing is
+	# removed when the dump timed out as it is incomplete.
+	def _remove_unseen(self, err):
+		seen = self._seen
+		self._seen = None
+		if err == -errno.ETIMEDOUT:
+			return
+		self._removed = set(self._bss.keys()) - seen
+		for key in self._removed:
+			del self._bss[key]
+			del self._fingerprint[key]
+
+	def _store_bss(self, nattrs, get_data, get_u32):
+		key = bss_key(get_data(nattrs[nl80211.BSS_BSSID]),
+			      get_u32(nattrs[nl80211.BSS_FREQUENCY]))
+		fp = tuple([ get_data(nattrs[aid]) if aid in nattrs else None
+			     for aid in self.compare_attrs ])
+		if self._seen != None:
+			self._seen.add(key)
+		if not key in self._bss:
+			self._added.add(key)
+		elif self._fingerprint[key] != fp:
+			self._changed.add(key)
+		else:
+			if nl80211.BSS_SEEN_MS_AGO in nattrs:
+				seen = get_u32(nattrs[nl80211.BSS_SEEN_MS_AGO])
+				self._bss[key].attrs[nl80211.BSS_SEEN_MS_AGO] = seen
+			return
+		self._bss[key] = factory.get_inst().create(bss, nattrs, bss_policy, self._proj)
+		self._fingerprint[key] = fp
 
 	def handle(self, msg, arg):
 		try:
@@ -77,22 +337,104 @@ class bss_list(custom_handler):
 			if not nl80211.ATTR_BSS in attrs:
 				return
 			e, nattrs = nl.py_nla_parse_nested(len(bss_policy), attrs[nl80211.ATTR_BSS], bss_policy)
-			self._bss.append(factory.get_inst().create(bss, nattrs, bss_policy))
+			get_data = lambda attr: str(nl.nla_data(attr))
+			self._store_bss(nattrs, get_data, nl.nla_get_u32)
 		except Exception as e:
 			(t,v,tb) = sys.exc_info()
 			print v.message
 			traceback.print_tb(tb)
 		return nl.NL_SKIP
 
+	def handle_raw(self, msg):
+		try:
+			attrs = msg.attrs
+			if not nl80211.ATTR_BSS in attrs:
+				return
+			nattrs = nlraw.parse_attrs(attrs[nl80211.ATTR_BSS], len(bss_policy))
+			get_data = lambda data: data.tobytes()
+			self._store_bss(nattrs, get_data, nlraw.get_u32)
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
+	##
+	# Property (GET) for obtaining the keys of the entries added by the
+	# last refresh.
+	@property
+	def added(self):
+		return self._added
+
+	##
+	# Property (GET) for obtaining the keys of the entries that changed in
+	# the last refresh.
+	@property
+	def changed(self):
+		return self._changed
+
+	##
+	# Property (GET) for obtaining the keys of the entries that were no
+	# longer reported in the last refresh.
+	@property
+	def removed(self):
+		return self._removed
+
+	def __iter__(self):
+		return iter(self._bss.values())
+
+	def __len__(self):
+		return len(self._bss)
+
+	def __contains__(self, key):
+		return key in self._bss
+
+	def keys(self):
+		return self._bss.keys()
+
+	##
+	# Returns the BSS with the given BSSID on the given frequency or None.
+	def get(self, bssid, freq):
+		return self._bss.get(bss_key(bssid, freq))
+
+##
+# Adds the scan attributes, ie. the SSIDs, frequencies, flags and extra
+# information elements, to the netlink message.
+def put_scan_attrs(msg, ssids=None, freqs=None, flags=0, ies=None):
+	if ssids:
+		i = 0
+		nest = nl.nla_nest_start(msg._msg, nl80211.ATTR_SCAN_SSIDS)
+		for ssid in ssids:
+			nl.nla_put(msg._msg, i, ssid)
+			i += 1
+		nl.nla_nest_end(msg._msg, nest)
+	if freqs:
+		i = 0
+		nest = nl.nla_nest_start(msg._msg, nl80211.ATTR_SCAN_FREQUENCIES)
+		for freq in freqs:
+			nl.nla_put_u32(msg._msg, i, freq)
+			i += 1
+		nl.nla_nest_end(msg._msg, nest)
+	if flags != 0:
+		nl.nla_put_u32(msg._msg, nl80211.ATTR_SCAN_FLAGS, flags)
+	if ies:
+		nl.nla_put(msg._msg, nl80211.ATTR_IE, ies)
+
 class scan_cmd_base(custom_handler):
 	def __init__(self, ifidx, level=nl.NL_CB_DEFAULT):
 		self._access = access80211(level)
 		self._nl_cmd = None
 		self._ifidx = ifidx
 
-	def _wait_for_completion(self):
+	##
+	# Waits for the scan to complete until the deadline obtained from the
+	# access80211 instance passes, in which case AccessTimeoutError is
+	# raised. Returns 0 or the negative error value of receiving.
+	def _wait_for_completion(self, deadline=None):
 		while self.scan_busy:
-			self._access._sock.recvmsgs(self._access._rx_cb)
+			err = self._access._recvmsgs(deadline)
+			if err < 0:
+				return err
+		return 0
 
 	def _prepare_cmd(self):
 		if self._nl_cmd == None:
@@ -102,18 +444,31 @@ class scan_cmd_base(custom_handler):
 		self._nl_msg = self._access.alloc_genlmsg(self._nl_cmd, flags)
 		nl.nla_put_u32(self._nl_msg._msg, nl80211.ATTR_IFINDEX, self._ifidx)
 
-	def _send_and_wait(self):
+	##
+	# Sends the command and waits for completion. The timeout (in seconds)
+	# applies to the whole operation.
+	def _send_and_wait(self, timeout=None):
 		self.scan_busy = True
 		self._access.disable_seq_check()
 		mcid = self._access.subscribe_multicast('scan')
-		ret = self._access.send(self._nl_msg, self)
-		if ret < 0:
+		try:
+			deadline = self._access._deadline(timeout)
+			ret = self._access.send(self._nl_msg, self, timeout)
+			if ret < 0:
+				return ret
+
+			ret = self._wait_for_completion(deadline)
+		finally:
 			self.scan_busy = False
-			return ret
+			self._access.drop_multicast(mcid)
+		return ret
 
-		self._wait_for_completion()
-		self._access.drop_multicast(mcid)
-		return 0
+	##
+	# Cancels waiting for completion, eg. from another thread, in which
+	# case send() raises AccessCancelledError. The scan itself is not
+	# aborted in the kernel.
+	def cancel(self):
+		self._access.cancel()
 
 class scan_start_base(scan_cmd_base):
 	def __init__(self, ifidx, level=nl.NL_CB_DEFAULT):
@@ -124,24 +479,7 @@ class scan_start_base(scan_cmd_base):
 		self._ies = None
 
 	def _add_scan_attrs(self):
-		if self._ssids:
-			i = 0
-			nest = nl.nla_nest_start(self._nl_msg._msg, nl80211.ATTR_SCAN_SSIDS)
-			for ssid in self._ssids:
-				nl.nla_put(self._nl_msg._msg, i, ssid)
-				i += 1
-			nl.nla_nest_end(self._nl_msg._msg, nest)
-		if self._freqs:
-			i = 0
-			nest = nl.nla_nest_start(self._nl_msg._msg, nl80211.ATTR_SCAN_FREQUENCIES)
-			for freq in self._freqs:
-				nl.nla_put_u32(self._nl_msg._msg, i, freq)
-				i += 1
-			nl.nla_nest_end(self._nl_msg._msg, nest)
-		if self._flags != 0:
-			nl.nla_put_u32(self._nl_msg._msg, nl80211.ATTR_SCAN_FLAGS, self._flags)
-		if self._ies:
-			nl.nla_put(self._nl_msg._msg, nl80211.ATTR_IE, self._ies)
+		put_scan_attrs(self._nl_msg, self._ssids, self._freqs, self._flags, self._ies)
 
 	def add_ssids(self, ssids):
 		if self._ssids == None:
@@ -165,10 +503,10 @@ class scan_start_base(scan_cmd_base):
 	def set_flags(self, flags):
 		self._flags = flags
 
-	def send(self):
+	def send(self, timeout=None):
 		self._prepare_cmd()
 		self._add_scan_attrs()
-		self._send_and_wait()
+		return self._send_and_wait(timeout)
 
 class scan_request(scan_start_base):
 	def __init__(self, ifidx, level=nl.NL_CB_DEFAULT):
@@ -183,21 +521,68 @@ class scan_request(scan_start_base):
 			self.scan_busy = False
 		return nl.NL_SKIP
 
+##
+# Scheduled scan plan attributes, which are not in the generated
+# definitions as they were added in Linux 4.4.
+ATTR_MAX_NUM_SCHED_SCAN_PLANS = 222
+ATTR_MAX_SCAN_PLAN_INTERVAL = 223
+ATTR_MAX_SCAN_PLAN_ITERATIONS = 224
+ATTR_SCHED_SCAN_PLANS = 225
+
+SCHED_SCAN_PLAN_INTERVAL = 1
+SCHED_SCAN_PLAN_ITERATIONS = 2
+
+##
+# Scheduled scan offloaded to the device. The interval (in ms) or the
+# scan plans determine when the device scans. The match sets limit the
+# results reported to the host. Each match set is a dictionary with the
+# optional keys 'ssid' and 'rssi', which is the minimum signal in dBm.
+# A match set with only 'rssi' sets the threshold for all match sets.
 class sched_scan_start(scan_start_base):
 	def __init__(self, ifidx, level=nl.NL_CB_DEFAULT):
 		super(sched_scan_start, self).__init__(ifidx, level)
 		self._nl_cmd = nl80211.CMD_START_SCHED_SCAN
 		self._interval = None
 		self._matches = None
+		self._plans = None
+		self._delay = None
 
 	def _add_scan_attrs(self):
 		super(sched_scan_start, self)._add_scan_attrs()
+		if self._interval != None and self._plans != None:
+			raise Exception("scan interval and scan plans can not be used together")
 		if self._interval != None:
 			nl.nla_put_u32(self._nl_msg._msg, nl80211.ATTR_SCHED_SCAN_INTERVAL, self._interval)
+		if self._plans:
+			plans = nl.nla_nest_start(self._nl_msg._msg, ATTR_SCHED_SCAN_PLANS)
+			for i, (interval, iterations) in enumerate(self._plans):
+				nest = nl.nla_nest_start(self._nl_msg._msg, i + 1)
+				nl.nla_put_u32(self._nl_msg._msg, SCHED_SCAN_PLAN_INTERVAL, interval)
+				if iterations:
+					nl.nla_put_u32(self._nl_msg._msg, SCHED_SCAN_PLAN_ITERATIONS, iterations)
+				nl.nla_nest_end(self._nl_msg._msg, nest)
+			nl.nla_nest_end(self._nl_msg._msg, plans)
+		if self._delay != None:
+			nl.nla_put_u32(self._nl_msg._msg, nl80211.ATTR_SCHED_SCAN_DELAY, self._delay)
 
 	def set_interval(self, interval):
 		self._interval = interval
 
+	##
+	# Sets the scan plans as list of (interval, iterations) tuples. The
+	# interval is in seconds. The last plan runs until the scheduled scan
+	# is stopped so its iterations must be None or 0. Requires Linux 4.4
+	# or later.
+	def set_plans(self, plans):
+		if plans and plans[-1][1]:
+			raise Exception("last scan plan can not have iterations")
+		self._plans = plans
+
+	##
+	# Sets the delay (in seconds) before the first scan.
+	def set_delay(self, delay):
+		self._delay = delay
+
 	def add_matches(self, matches):
 		self._matches = matches
 
@@ -210,16 +595,20 @@ class sched_scan_start(scan_start_base):
 				nest = nl.nla_nest_start(self._nl_msg._msg, i)
 				if 'ssid' in match:
 					nl.nla_put(self._nl_msg._msg, nl80211.SCHED_SCAN_MATCH_ATTR_SSID, match['ssid'])
+				if 'rssi' in match:
+					# s32 value so pass it as 2s complement.
+					nl.nla_put_u32(self._nl_msg._msg, nl80211.SCHED_SCAN_MATCH_ATTR_RSSI,
+						       match['rssi'] & 0xffffffff)
 				i += 1
 				nl.nla_nest_end(self._nl_msg._msg, nest)
 
 			nl.nla_nest_end(self._nl_msg._msg, matchset)
 
-	def send(self):
+	def send(self, timeout=None):
 		self._prepare_cmd()
 		self._add_scan_attrs()
 		self._add_matches_attrs()
-		self._send_and_wait()
+		return self._send_and_wait(timeout)
 
 	def handle(self, msg, arg):
 		genlh = genl.genlmsg_hdr(nl.nlmsg_hdr(msg))
@@ -234,12 +623,286 @@ class sched_scan_stop(scan_cmd_base):
 		super(sched_scan_stop, self).__init__(ifidx, level)
 		self._nl_cmd = nl80211.CMD_STOP_SCHED_SCAN
 
-	def send(self):
+	def send(self, timeout=None):
 		self._prepare_cmd()
-		self._send_and_wait()
+		return self._send_and_wait(timeout)
 
 	def handle(self, msg, arg):
 		genlh = genl.genlmsg_hdr(nl.nlmsg_hdr(msg))
 		if genlh.cmd in [ nl80211.CMD_SCHED_SCAN_STOPPED ]:
 			self.scan_busy = False
 		return nl.NL_SKIP
+
+##
+# Streams the results of a scheduled scan on an interface. Upon each
+# CMD_SCHED_SCAN_RESULTS notification the scan results are dumped into a
+# bss_cache and the BSSs that were added or changed are passed to the
+# callback as list of bss instances and put on the queue, if given. The
+# results present upon creation are not reported. The only and exclude
+# arguments specify a projection on the BSS attributes like for bss_list.
+#
+# The notifications are received using a monitor instance subscribed to
+# the 'scan' group, which is created if none is given.
+class sched_scan_results(object):
+	def __init__(self, ifidx, callback=None, queue=None, mon=None, access=None,
+		     kind=nl.NL_CB_DEFAULT, only=None, exclude=None):
+		self._own_mon = mon == None
+		if mon == None:
+			import monitor
+			mon = monitor.monitor([ 'scan' ])
+		self._ifidx = ifidx
+		self._callback = callback
+		self._queue = queue
+		self._mon = mon
+		self._stopped = False
+		self._pending = None
+		self._cache = bss_cache(ifidx, kind, access, only, exclude)
+		mon.add_callback(self._scan_event, [ nl80211.CMD_SCHED_SCAN_RESULTS,
+						     nl80211.CMD_SCHED_SCAN_STOPPED ])
+		mon.add_overrun_callback(self._fetch)
+
+	def _scan_event(self, evt):
+		if evt.ifindex != self._ifidx:
+			return
+		if evt.cmd == nl80211.CMD_SCHED_SCAN_STOPPED:
+			self._stopped = True
+			return
+		self._fetch()
+
+	def _fetch(self):
+		self._cache.refresh()
+		keys = self._cache.added | self._cache.changed
+		if len(keys) == 0:
+			return
+		result = [ self._cache.get(bssid, freq) for bssid, freq in keys ]
+		if self._pending != None:
+			self._pending.append(result)
+		if self._queue != None:
+			self._queue.put(result)
+		if self._callback != None:
+			self._callback(result)
+
+	##
+	# Generator yielding the bss instances as they are reported until the
+	# scheduled scan is stopped or the timeout (in seconds) expires.
+	def results(self, timeout=None):
+		if timeout != None:
+			deadline = time.time() + timeout
+		poller = select.poll()
+		poller.register(self._mon.fileno(), select.POLLIN)
+		self._pending = deque()
+		try:
+			while True:
+				while len(self._pending) > 0:
+					for b in self._pending.popleft():
+						yield b
+				if self._stopped:
+					break
+				if timeout == None:
+					poller.poll()
+				else:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						break
+					poller.poll(remaining * 1000)
+				self._mon.process()
+		finally:
+			self._pending = None
+
+	##
+	# Property (GET) indicating whether the scheduled scan was stopped.
+	@property
+	def stopped(self):
+		return self._stopped
+
+	##
+	# Property (GET) for obtaining the bss_cache holding all results.
+	@property
+	def bss(self):
+		return self._cache
+
+	def close(self):
+		self._mon.remove_callback(self._scan_event)
+		self._mon.remove_overrun_callback(self._fetch)
+		if self._own_mon:
+			self._mon.close()
+
+##
+# Scan of a single interface in a multi_scan. The bss attribute holds the
+# bss_list once the results are dumped. The error attribute holds the
+# negative error value when triggering the scan or dumping the results
+# failed, or 'timeout'. The latency is the time in seconds from
+# triggering the scans until the results of this interface were complete.
+class iface_scan(object):
+	def __init__(self, ifidx):
+		self.ifidx = ifidx
+		self.aborted = False
+		self.bss = None
+		self.error = None
+		self.latency = None
+		self._fetching = False
+		self._done = False
+
+	def done(self):
+		return self._done
+
+##
+# bss_list keeping the request of the last refresh so multi_scan can
+# tell when the results are complete.
+class _bss_fetch(bss_list):
+	def refresh(self):
+		self.request = bss_list.refresh(self)
+		return self.request
+
+##
+# Scan on multiple interfaces over a single access80211_mux socket. The
+# scan is triggered on all interfaces at once so the scans run in
+# parallel. When CMD_NEW_SCAN_RESULTS or CMD_SCAN_ABORTED is received for
+# an interface its results are dumped while the other interfaces are
+# still scanning, and results() yields its iface_scan as soon as the dump
+# is complete. The only and exclude arguments specify a projection on
+# the BSS attributes like for bss_list.
+class multi_scan(custom_handler):
+	def __init__(self, ifindexes, access=None, only=None, exclude=None):
+		if access == None:
+			access = mux.access80211_mux()
+		elif not isinstance(access, mux.access80211_mux):
+			raise Exception("provided 'access' is not a access80211_mux instance")
+		self._access = access
+		self._only = only
+		self._exclude = exclude
+		self._scans = dict([ (ifidx, iface_scan(ifidx)) for ifidx in ifindexes ])
+		self._ready = deque()
+		self._requests = []
+		self._mcid = None
+		self._start = None
+		self._ssids = None
+		self._freqs = None
+		self._flags = 0
+		self._ies = None
+
+	def add_ssids(self, ssids):
+		if self._ssids == None or ssids == None:
+			self._ssids = ssids
+		else:
+			self._ssids = self._ssids + ssids
+
+	def add_freqs(self, freqs):
+		if self._freqs == None or freqs == None:
+			self._freqs = freqs
+		else:
+			self._freqs = self._freqs + freqs
+
+	def set_ies(self, ies):
+		self._ies = ies
+
+	def set_flags(self, flags):
+		self._flags = flags
+
+	##
+	# Triggers the scan on all interfaces without waiting for completion.
+	def trigger(self):
+		self._start = time.time()
+		self._access.set_notify_handler(self)
+		self._mcid = self._access.subscribe_multicast('scan')
+		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK
+		for scan in self._scans.values():
+			m = self._access.alloc_genlmsg(nl80211.CMD_TRIGGER_SCAN, flags)
+			nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, scan.ifidx)
+			put_scan_attrs(m, self._ssids, self._freqs, self._flags, self._ies)
+			req = self._access.send(m, self)
+			self._requests.append(req)
+			req.add_done_callback(lambda req, scan=scan: self._triggered(scan, req))
+
+	def _triggered(self, scan, req):
+		if req.error < 0:
+			self._complete(scan, req.error)
+
+	def _fetch(self, scan):
+		scan._fetching = True
+		lst = factory.get_inst().create(_bss_fetch, scan.ifidx, access=self._access,
+						only=self._only, exclude=self._exclude)
+		self._requests.append(lst.request)
+		lst.request.add_done_callback(lambda req: self._fetched(scan, lst, req))
+
+	def _fetched(self, scan, lst, req):
+		if req.error < 0:
+			self._complete(scan, req.error)
+		else:
+			scan.bss = lst
+			self._complete(scan, None)
+
+	def _complete(self, scan, error):
+		if scan.done():
+			return
+		scan.error = error
+		scan.latency = time.time() - self._start
+		scan._done = True
+		self._ready.append(scan)
+
+	# only used with access80211_mux, which parses the messages in python.
+	def handle(self, msg, arg):
+		return nl.NL_SKIP
+
+	##
+	# Handles the scan notifications. The results are also dumped when the
+	# scan was aborted as the kernel keeps the results found so far.
+	def handle_raw(self, msg):
+		try:
+			if not msg.cmd in [ nl80211.CMD_NEW_SCAN_RESULTS, nl80211.CMD_SCAN_ABORTED ]:
+				return
+			attrs = msg.attrs
+			if not nl80211.ATTR_IFINDEX in attrs:
+				return
+			scan = self._scans.get(nlraw.get_u32(attrs[nl80211.ATTR_IFINDEX]))
+			if scan == None or scan._fetching or scan.done():
+				return
+			scan.aborted = msg.cmd == nl80211.CMD_SCAN_ABORTED
+			self._fetch(scan)
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
+	##
+	# Generator yielding an iface_scan instance for each interface as soon
+	# as its results are complete. The scan is triggered if not done so
+	# already. Interfaces that are not complete within the timeout (in
+	# seconds) since triggering are yielded with a 'timeout' error. The
+	# requests still pending when the generator ends are dropped from the
+	# access so a later wait() on it does not wait for them.
+	def results(self, timeout=None):
+		if self._start == None:
+			self.trigger()
+		if timeout != None:
+			deadline = self._start + timeout
+		poller = select.poll()
+		poller.register(self._access.fileno(), select.POLLIN)
+		try:
+			while True:
+				while len(self._ready) > 0:
+					yield self._ready.popleft()
+				busy = [ scan for scan in self._scans.values() if not scan.done() ]
+				if len(busy) == 0:
+					break
+				if timeout == None:
+					poller.poll()
+				else:
+					remaining = deadline - time.time()
+					if remaining <= 0:
+						for scan in busy:
+							self._complete(scan, 'timeout')
+						continue
+					poller.poll(remaining * 1000)
+				self._access.process()
+		finally:
+			self._access._expire(self._requests)
+			self._requests = []
+			self._access.drop_multicast(self._mcid)
+			self._access.set_notify_handler(None)
+
+	##
+	# Scans all interfaces and returns the list of iface_scan instances
+	# in order of completion.
+	def run(self, timeout=None):
+		return list(self.results(timeout))
@@ -0,0 +1,172 @@
+##
+# Module providing a rolling background scan using partial scans.
+
+#
+# Copyright 2015 Arend van Spriel <aspriel@gmail.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+import time
+
+import netlink.capi as nl
+import generated.defs as nl80211
+
+from base import *
+from iface import iter_interfaces
+from wiphy import iter_wiphy
+from scan import scan_request, bss_cache
+
+##
+# Returns the frequencies of the channels that are not disabled on the
+# wiphy of the interface.
+def iface_freqs(ifidx, access=None, kind=nl.NL_CB_DEFAULT):
+	if access == None:
+		access = access80211(kind, raw=True)
+	phynum = None
+	for iface in iter_interfaces(access, only=[ nl80211.ATTR_IFINDEX, nl80211.ATTR_WIPHY ]):
+		if iface.attrs.get(nl80211.ATTR_IFINDEX) == ifidx:
+			phynum = iface.attrs[nl80211.ATTR_WIPHY]
+	if phynum == None:
+		raise Exception("interface %d not found" % ifidx)
+	freqs = []
+	for phy in iter_wiphy(access):
+		if phy.phynum != phynum:
+			continue
+		for band in phy.attrs.get(nl80211.ATTR_WIPHY_BANDS, []):
+			for freq in band.attrs.get(nl80211.BAND_ATTR_FREQS, []):
+				if not nl80211.FREQUENCY_ATTR_DISABLED in freq.attrs:
+					freqs.append(freq.attrs[nl80211.FREQUENCY_ATTR_FREQ])
+	return freqs
+
+##
+# Rolling background scan on an interface. Instead of scanning all
+# channels at once, which keeps the device off-channel for a long time,
+# each step() scans a group of at most group_size channels. The results
+# are merged into a bss_cache, which is the continuously updated view of
+# the BSSs on the interface (see bss property).
+#
+# The channels are picked by priority, which is the time since they were
+# last scanned weighted by the number of BSSs seen on them. So occupied
+# channels are scanned more often. Channels not scanned for max_age
+# seconds are picked first so every channel is visited regularly. The
+# scan flags default to SCAN_FLAG_LOW_PRIORITY.
+#
+# The given access is used for obtaining the channels and dumping the
+# scan results. By default a raw access is created for that. The scan
+# itself is requested over an access of its own as it waits for the
+# scan notifications.
+class rolling_scanner(object):
+	def __init__(self, ifidx, freqs=None, group_size=3, interval=1.0, max_age=30.0,
+		     flags=nl80211.SCAN_FLAG_LOW_PRIORITY, scan_timeout=5.0,
+		     access=None, kind=nl.NL_CB_DEFAULT):
+		if access == None:
+			access = access80211(kind, raw=True)
+		if freqs == None:
+			freqs = iface_freqs(ifidx, access)
+		self._ifidx = ifidx
+		self._freqs = list(freqs)
+		self._group_size = group_size
+		self._interval = interval
+		self._max_age = max_age
+		self._scan_timeout = scan_timeout
+		self._running = False
+		self._last = dict([ (freq, None) for freq in self._freqs ])
+		self._occupancy = dict([ (freq, 0) for freq in self._freqs ])
+		self._req = scan_request(ifidx, kind)
+		self._req.set_flags(flags)
+		self._cache = bss_cache(ifidx, kind, access)
+		self._count_occupancy()
+
+	def _count_occupancy(self):
+		counts = dict([ (freq, 0) for freq in self._freqs ])
+		for bssid, freq in self._cache.keys():
+			if freq in counts:
+				counts[freq] += 1
+		self._occupancy = counts
+
+	##
+	# Returns the channels to scan next ordered by priority.
+	def next_group(self, now=None):
+		if now == None:
+			now = time.time()
+		def priority(freq):
+			last = self._last[freq]
+			if last == None or now - last >= self._max_age:
+				# never or too long ago scanned goes first.
+				return (1, 0 if last == None else now - last)
+			return (0, (now - last) * (1 + self._occupancy[freq]))
+		order = sorted(self._freqs, key=priority, reverse=True)
+		return order[:self._group_size]
+
+	##
+	# Scans the next group of channels and merges the results. Returns
+	# the list of scanned frequencies or the negative error value when the
+	# scan could not be done, eg. -EBUSY while another scan is ongoing.
+	def step(self):
+		group = self.next_group()
+		self._req.add_freqs(None)
+		self._req.add_freqs(group)
+		ret = self._req.send(self._scan_timeout)
+		if ret < 0:
+			return ret
+		now = time.time()
+		for freq in group:
+			self._last[freq] = now
+		self._cache.refresh()
+		self._count_occupancy()
+		return group
+
+	##
+	# Scans at the fixed interval until stop() is called or the given
+	# number of steps is done.
+	def run(self, count=None):
+		self._running = True
+		while self._running and count != 0:
+			try:
+				self.step()
+			except AccessCancelledError:
+				break
+			except AccessTimeoutError as e:
+				# try the next group of channels.
+				print e.message
+			if count != None:
+				count -= 1
+			if self._running and count != 0:
+				time.sleep(self._interval)
+		self._running = False
+
+	def stop(self):
+		self._running = False
+		self._req.cancel()
+
+	##
+	# Property (GET) for obtaining the bss_cache holding the merged scan
+	# results. Its added, changed and removed properties provide the
+	# changes of the last step().
+	@property
+	def bss(self):
+		return self._cache
+
+	##
+	# Returns dictionary mapping frequency to the number of BSSs seen.
+	def occupancy(self):
+		return dict(self._occupancy)
+
+	##
+	# Returns dictionary mapping frequency to the seconds since it was
+	# last scanned or None if it was not scanned yet.
+	def ages(self, now=None):
+		if now == None:
+			now = time.time()
+		return dict([ (freq, None if last == None else now - last)
+			      for freq, last in self._last.items() ])
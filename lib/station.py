@@ -19,6 +19,9 @@
 import sys
 import traceback
 import struct
+import errno
+import time
+from collections import OrderedDict
 
 import netlink.capi as nl
 import netlink.core as nlc
@@ -28,6 +31,8 @@ import generated.defs as nl80211
 from generated.policy import nl80211_policy
 from base import *
 import factory
+import nlraw
+import mux
 
 bss_param_policy = nl.nla_policy_array(nl80211.STA_BSS_PARAM_MAX + 1)
 bss_param_policy[nl80211.STA_BSS_PARAM_CTS_PROT].type = nl.NLA_FLAG
@@ -36,8 +41,8 @@ bss_param_policy[nl80211.STA_BSS_PARAM_SHORT_SLOT_TIME].type = nl.NLA_FLAG
 bss_param_policy[nl80211.STA_BSS_PARAM_DTIM_PERIOD].type = nl.NLA_U8
 bss_param_policy[nl80211.STA_BSS_PARAM_BEACON_INTERVAL].type = nl.NLA_U16
 
-class bss_param(nl80211_object):
-	pass
+class bss_param(record_class(bss_param_policy)):
+	__slots__ = ()
 
 bitrate_policy = nl.nla_policy_array(nl80211.RATE_INFO_MAX + 1)
 bitrate_policy[nl80211.RATE_INFO_BITRATE].type = nl.NLA_U16
@@ -46,8 +51,8 @@ bitrate_policy[nl80211.RATE_INFO_MCS].type = nl.NLA_U8
 bitrate_policy[nl80211.RATE_INFO_40_MHZ_WIDTH].type = nl.NLA_FLAG
 bitrate_policy[nl80211.RATE_INFO_SHORT_GI].type = nl.NLA_FLAG
 
-class bitrate(nl80211_object):
-	pass
+class bitrate(record_class(bitrate_policy)):
+	__slots__ = ()
 
 stats_policy = nl.nla_policy_array(nl80211.STA_INFO_MAX + 1)
 stats_policy[nl80211.STA_INFO_INACTIVE_TIME].type = nl.NLA_U32
@@ -86,17 +91,20 @@ stats_policy[nl80211.STA_INFO_CONNECTED_TIME].type = nl.NLA_U32
 stats_policy[nl80211.STA_INFO_BSS_PARAM].type = nl.NLA_NESTED
 stats_policy[nl80211.STA_INFO_BSS_PARAM].single = True
 
+for policy in [ bss_param_policy, bitrate_policy, stats_policy, nl80211_policy ]:
+	compile_policy(policy)
+
 class station_stats(nl80211_object):
 	nest_attr_map = {
 		nl80211.STA_INFO_TX_BITRATE: (bitrate, len(bitrate_policy), bitrate_policy),
 		nl80211.STA_INFO_RX_BITRATE: (bitrate, len(bitrate_policy), bitrate_policy),
 		nl80211.STA_INFO_BSS_PARAM: (bss_param, len(bss_param_policy), bss_param_policy)
 	}
-	def __init__(self, attrs, policy):
-		nl80211_object.__init__(self, attrs, policy)
+	def __init__(self, attrs, policy, proj=None):
+		nl80211_object.__init__(self, attrs, policy, proj)
 
 	def post_store_attrs(self, attrs):
-		if nl80211.STA_INFO_STA_FLAGS in attrs:
+		if nl80211.STA_INFO_STA_FLAGS in attrs and nl80211.STA_INFO_STA_FLAGS in self.attrs:
 			flags = factory.get_inst().create(sta_flags, self.attrs[nl80211.STA_INFO_STA_FLAGS])
 			self._attrs[nl80211.STA_INFO_STA_FLAGS] = flags
 
@@ -111,8 +119,8 @@ class station(nl80211_managed_object):
 		nl80211.ATTR_STA_INFO: (station_stats, len(stats_policy), stats_policy)
 	}
 	_cmd = nl80211.CMD_GET_STATION
-	def __init__(self, ifidx, mac, access=None, attrs=None):
-		nl80211_managed_object.__init__(self, access, attrs, nl80211_policy)
+	def __init__(self, ifidx, mac, access=None, attrs=None, proj=None):
+		nl80211_managed_object.__init__(self, access, attrs, nl80211_policy, proj)
 		self._ifidx = ifidx
 		if nl80211.ATTR_MAC in self.attrs:
 			self._mac = self.attrs[nl80211.ATTR_MAC]
@@ -128,42 +136,256 @@ class station(nl80211_managed_object):
 		nl.nla_put_u32(msg._msg, nl80211.ATTR_IFINDEX, self._ifidx)
 		nl.nla_put(msg._msg, nl80211.ATTR_MAC, self._mac)
 
+	def obj_key(self):
+		return (self._ifidx, str(self._mac))
+
+	@property
+	def mac(self):
+		return self._mac
+
 	def __hash__(self):
-		mac_hash = self._mac[1:3] + self._mac[4:6]
-		return struct.unpack('i', mac_hash)[0]
+		return hash(mac_key(self._mac))
 
 	def __cmp__(self, other):
-		return self.__hash__() - other.__hash__()
+		return cmp(mac_key(self._mac), mac_key(other._mac))
+
+##
+# Returns the key used for indexing stations by the full MAC address.
+def mac_key(mac):
+	return str(mac)
+
+##
+# Requests the stations with the given MAC addresses on an interface with
+# all requests in flight at the same time using access80211_mux. The
+# replies are matched to the stations by sequence number so the refresh
+# takes about one round trip instead of one per station. Returns the list
+# of station instances in the order of the MAC addresses with None for
+# the stations that could not be obtained within the timeout (in seconds)
+# or for which the kernel returned an error, eg. because it has left.
+def refresh_many(ifidx, macs, access=None, timeout=None):
+	if access == None:
+		access = mux.access80211_mux()
+	elif not isinstance(access, mux.access80211_mux):
+		raise Exception("provided 'access' is not a access80211_mux instance")
+	stations = []
+	reqs = []
+	for mac in macs:
+		attrs = nlraw.raw_attrs()
+		attrs[nl80211.ATTR_MAC] = memoryview(bytearray(mac))
+		sta = factory.get_inst().create(station, ifidx, None, access, attrs)
+		stations.append(sta)
+		reqs.append(sta.refresh())
+	access.wait(reqs, timeout)
+	result = []
+	for sta, req in zip(stations, reqs):
+		if req.done() and req.error == 0:
+			result.append(sta)
+		else:
+			result.append(None)
+	return result
+
+##
+# Generator yielding a station instance for each station as soon as it
+# is received. The caller may stop early without the remaining stations
+# being decoded.
+def iter_stations(ifidx, access=None, kind=nl.NL_CB_DEFAULT, only=None, exclude=None):
+	if access == None:
+		access = access80211(kind)
+	proj = make_projection(only, exclude, [ nl80211.ATTR_MAC ])
+	flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
+	m = access.alloc_genlmsg(nl80211.CMD_GET_STATION, flags)
+	nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, ifidx)
+	for msg in access.dump_raw(m):
+		yield factory.get_inst().create(station, ifidx, None, access, msg.attrs, proj)
 
+##
+# List of stations on an interface indexed by MAC address. Stations are
+# kept in the order in which they were first received. The only and
+# exclude arguments specify a projection limiting the attributes that
+# are decoded (see base.projection).
 class station_list(custom_handler):
-	def __init__(self, ifidx, access=None, kind=nl.NL_CB_DEFAULT):
-		self._station = []
+	def __init__(self, ifidx, access=None, kind=nl.NL_CB_DEFAULT, only=None, exclude=None):
+		self._station = OrderedDict()
 		self._ifidx = ifidx
+		self._proj = make_projection(only, exclude, [ nl80211.ATTR_MAC ])
 		if access == None:
 			access = access80211(kind)
-		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
-		m = access.alloc_genlmsg(nl80211.CMD_GET_STATION, flags)
-		nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, ifidx)
 		self._access = access
-		access.send(m, self)
+		self._seen = None
+		self.refresh()
+
+	##
+	# Dumps the stations again updating the stations already in the list
+	# and removing the ones no longer reported by the kernel. Returns the
+	# result of the send() method of the access instance. With
+	# access80211_mux that is the request and the stations are removed
+	# when it completes.
+	def refresh(self):
+		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
+		m = self._access.genlmsg_template(nl80211.CMD_GET_STATION, flags, self._ifidx,
+			lambda m: nl.nla_put_u32(m._msg, nl80211.ATTR_IFINDEX, self._ifidx))
+		self._seen = set()
+		ret = self._access.send(m, self)
+		if isinstance(ret, mux.request):
+			ret.add_done_callback(lambda req: self._remove_unseen(req.error))
+		else:
+			self._remove_unseen(ret)
+		return ret
+
+	##
+	# Removes the stations not reported by the completed dump. Nothing is
+	# removed when the dump timed out as it is incomplete.
+	def _remove_unseen(self, err):
+		seen = self._seen
+		self._seen = None
+		if err == -errno.ETIMEDOUT:
+			return
+		for key in self._station.keys():
+			if not key in seen:
+				del self._station[key]
 
 	def __iter__(self):
-		return iter(self._station)
+		return iter(self._station.values())
+
+	def __len__(self):
+		return len(self._station)
+
+	def __contains__(self, mac):
+		return mac_key(mac) in self._station
+
+	##
+	# Returns the station with the given MAC address or None.
+	def get(self, mac):
+		return self._station.get(mac_key(mac))
+
+	def remove(self, mac):
+		self._station.pop(mac_key(mac), None)
 
 	def store_station(self, sta):
-		for s in self._station:
-			if s == sta:
-				s._attrs = sta._attrs
-				return
-		self._station.append(sta)
+		key = mac_key(sta.mac)
+		if self._seen != None:
+			self._seen.add(key)
+		if key in self._station:
+			self._station[key]._attrs = sta._attrs
+		else:
+			self._station[key] = sta
 
 	def handle(self, msg, arg):
 		try:
 			e, attrs = genl.py_genlmsg_parse(nl.nlmsg_hdr(msg), 0, nl80211.ATTR_MAX, None)
-			sta = factory.get_inst().create(station, self._ifidx, None, self._access, attrs)
+			sta = factory.get_inst().create(station, self._ifidx, None, self._access, attrs, self._proj)
 			s = self.store_station(sta)
 			return nl.NL_SKIP
 		except Exception as e:
 			(t,v,tb) = sys.exc_info()
 			print v.message
 			traceback.print_tb(tb)
+
+	def handle_raw(self, msg):
+		try:
+			sta = factory.get_inst().create(station, self._ifidx, None, self._access, msg.attrs, self._proj)
+			self.store_station(sta)
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
+##
+# Live table of the stations on an interface. It is seeded with a single
+# station dump and kept current using the CMD_NEW_STATION and
+# CMD_DEL_STATION notifications received by the given monitor instance
+# (see monitor module). A monitor subscribed to the 'mlme' group is
+# created if none is given. The station statistics are only requested
+# again for stations whose data is older than max_age (in seconds) when
+# refresh_stale() is called. The table is dumped again when the monitor
+# reports notifications were lost.
+class station_table(object):
+	def __init__(self, ifidx, mon=None, access=None, kind=nl.NL_CB_DEFAULT, max_age=1.0):
+		self._own_mon = mon == None
+		if mon == None:
+			import monitor
+			mon = monitor.monitor([ 'mlme' ])
+		if access == None:
+			access = access80211(kind)
+		self._ifidx = ifidx
+		self._access = access
+		self._mon = mon
+		self._max_age = max_age
+		self._updated = {}
+		self._list = station_list(ifidx, access)
+		self._seeded(time.time())
+		mon.add_callback(self._station_event, [ nl80211.CMD_NEW_STATION, nl80211.CMD_DEL_STATION ])
+		mon.add_overrun_callback(self.resync)
+
+	def _seeded(self, now):
+		self._updated = {}
+		for sta in self._list:
+			self._updated[mac_key(sta.mac)] = now
+
+	def _station_event(self, evt):
+		if evt.ifindex != self._ifidx:
+			return
+		mac = evt.attrs[nl80211.ATTR_MAC]
+		if evt.cmd == nl80211.CMD_DEL_STATION:
+			self._list.remove(mac)
+			self._updated.pop(mac_key(mac), None)
+			return
+		sta = factory.get_inst().create(station, self._ifidx, None, self._access, evt.raw_attrs)
+		self._list.store_station(sta)
+		self._updated[mac_key(mac)] = time.time()
+
+	##
+	# Dumps all stations again, eg. because notifications were lost.
+	def resync(self):
+		self._list.refresh()
+		self._seeded(time.time())
+
+	##
+	# Requests the data for stations that were not updated within max_age
+	# seconds and returns the number of stations refreshed.
+	def refresh_stale(self, max_age=None):
+		if max_age == None:
+			max_age = self._max_age
+		now = time.time()
+		count = 0
+		for sta in list(self._list):
+			key = mac_key(sta.mac)
+			if now - self._updated.get(key, 0) < max_age:
+				continue
+			sta.refresh()
+			self._updated[key] = now
+			count += 1
+		return count
+
+	##
+	# Processes the pending notifications and refreshes the stale
+	# stations. This can be called at every poll interval.
+	def update(self):
+		self._mon.process()
+		return self.refresh_stale()
+
+	##
+	# Returns the time in seconds since the station data was updated.
+	def age(self, mac):
+		return time.time() - self._updated[mac_key(mac)]
+
+	def __iter__(self):
+		return iter(self._list)
+
+	def __len__(self):
+		return len(self._list)
+
+	def __contains__(self, mac):
+		return mac in self._list
+
+	def get(self, mac):
+		return self._list.get(mac)
+
+	##
+	# Unregisters from the monitor, which is closed when it was created
+	# by the table.
+	def close(self):
+		self._mon.remove_callback(self._station_event)
+		self._mon.remove_overrun_callback(self.resync)
+		if self._own_mon:
+			self._mon.close()
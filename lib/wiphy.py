@@ -17,8 +17,12 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 import sys
+import os
+import socket
 import traceback
 import struct
+import mmap
+from collections import OrderedDict
 
 import netlink.capi as nl
 import netlink.core as nlc
@@ -28,13 +32,15 @@ import generated.defs as nl80211
 from generated.policy import nl80211_policy
 from base import *
 import factory
+import nlraw
+import mux
 
 rate_policy = nl.nla_policy_array(nl80211.BITRATE_ATTR_MAX + 1)
 rate_policy[nl80211.BITRATE_ATTR_RATE].type = nl.NLA_U32
 rate_policy[nl80211.BITRATE_ATTR_2GHZ_SHORTPREAMBLE].type = nl.NLA_FLAG
 
-class wiphy_rate(nl80211_object):
-	pass
+class wiphy_rate(record_class(rate_policy)):
+	__slots__ = ()
 
 freq_policy = nl.nla_policy_array(nl80211.FREQUENCY_ATTR_MAX + 1)
 freq_policy[nl80211.FREQUENCY_ATTR_FREQ].type = nl.NLA_U32
@@ -50,8 +56,8 @@ freq_policy[nl80211.FREQUENCY_ATTR_NO_160MHZ].type = nl.NLA_FLAG
 freq_policy[nl80211.FREQUENCY_ATTR_DFS_STATE].type = nl.NLA_U32
 freq_policy[nl80211.FREQUENCY_ATTR_DFS_TIME].type = nl.NLA_U32
 
-class wiphy_freq(nl80211_object):
-	pass
+class wiphy_freq(record_class(freq_policy)):
+	__slots__ = ()
 
 band_policy = nl.nla_policy_array(nl80211.BAND_ATTR_MAX + 1)
 band_policy[nl80211.BAND_ATTR_FREQS].type = nl.NLA_NESTED
@@ -64,11 +70,34 @@ band_policy[nl80211.BAND_ATTR_VHT_MCS_SET].type = nl.NLA_UNSPEC
 band_policy[nl80211.BAND_ATTR_VHT_CAPA].type = nl.NLA_U32
 
 class wiphy_band(nl80211_object):
+	split_attrs = [ nl80211.BAND_ATTR_FREQS, nl80211.BAND_ATTR_RATES ]
 	nest_attr_map = {
 		nl80211.BAND_ATTR_FREQS: (wiphy_freq, len(freq_policy), freq_policy),
 		nl80211.BAND_ATTR_RATES: (wiphy_rate, len(rate_policy), rate_policy)
 	}
 
+##
+# Parses the attributes in the given list of raw payloads into a single
+# raw_attrs instance. The payloads of the attributes in split_attrs are
+# concatenated, for the others the last occurrence wins.
+def merge_split_attrs(payloads, maxtype, split_attrs):
+	attrs = nlraw.raw_attrs()
+	chunks = {}
+	for payload in payloads:
+		for aid, data in nlraw.iter_attrs(payload):
+			if aid > maxtype:
+				continue
+			if aid in split_attrs:
+				chunks.setdefault(aid, []).append(data)
+			else:
+				attrs[aid] = data
+	for aid in chunks.keys():
+		if len(chunks[aid]) == 1:
+			attrs[aid] = chunks[aid][0]
+		else:
+			attrs[aid] = memoryview(''.join([ c.tobytes() for c in chunks[aid] ]))
+	return attrs
+
 iface_limit_policy = nl.nla_policy_array(nl80211.NUM_NL80211_IFACE_LIMIT)
 iface_limit_policy[nl80211.IFACE_LIMIT_TYPES].type = nl.NLA_NESTED
 iface_limit_policy[nl80211.IFACE_LIMIT_MAX].type = nl.NLA_U32
@@ -100,6 +129,10 @@ wowlan_policy[nl80211.WOWLAN_TRIG_4WAY_HANDSHAKE].type = nl.NLA_FLAG
 wowlan_policy[nl80211.WOWLAN_TRIG_RFKILL_RELEASE].type = nl.NLA_FLAG
 wowlan_policy[nl80211.WOWLAN_TRIG_NET_DETECT].type = nl.NLA_FLAG
 
+for policy in [ rate_policy, freq_policy, band_policy, iface_limit_policy,
+		iface_combination_policy, wowlan_policy, nl80211_policy ]:
+	compile_policy(policy)
+
 class wowlan_trigger_support(nl80211_object):
 	pass
 
@@ -110,15 +143,111 @@ class wiphy(nl80211_managed_object):
 		nl80211.ATTR_WOWLAN_TRIGGERS_SUPPORTED: (wowlan_trigger_support, len(wowlan_policy), wowlan_policy)
 	}
 	_cmd = nl80211.CMD_GET_WIPHY
-	def __init__(self, access, attrs):
-		nl80211_managed_object.__init__(self, access, attrs, nl80211_policy)
-		self._phynum = nl.nla_get_u32(attrs[nl80211.ATTR_WIPHY])
+	##
+	# Attributes that are spread over multiple messages in a split wiphy
+	# dump. Their raw payloads are concatenated.
+	split_attrs = [ nl80211.ATTR_WIPHY_BANDS, nl80211.ATTR_SUPPORTED_COMMANDS ]
+	def __init__(self, access, attrs, proj=None):
+		self._split_chunks = {}
+		self._split_pending = set()
+		nl80211_managed_object.__init__(self, access, attrs, nl80211_policy, proj)
+		self._phynum = self.attrs[nl80211.ATTR_WIPHY]
+
+	##
+	# Stores the attributes collecting the payloads of the split_attrs,
+	# which is needed for split wiphy dumps. The payloads are joined upon
+	# the next access of the attributes so they are joined only once for
+	# a complete dump. The merged attributes are kept in raw form so they
+	# are only decoded upon access.
+	def store_attrs(self, attrs):
+		is_raw = isinstance(attrs, nlraw.raw_attrs)
+		split = [ aid for aid in self.split_attrs if aid in attrs ]
+		if len(split) == 0:
+			nl80211_managed_object.store_attrs(self, attrs)
+			return
+		if self._proj != None:
+			split = self._proj.select(split)
+		for aid in split:
+			if is_raw:
+				data = attrs[aid].tobytes()
+			else:
+				data = str(nl.nla_data(attrs[aid]))
+			self._split_chunks.setdefault(aid, []).append(data)
+			self._split_pending.add(aid)
+		if is_raw:
+			rest = nlraw.raw_attrs()
+		else:
+			rest = {}
+		for aid in attrs.keys():
+			if not aid in self.split_attrs:
+				rest[aid] = attrs[aid]
+		nl80211_managed_object.store_attrs(self, rest)
+
+	##
+	# Joins the payloads of the split_attrs collected since the attributes
+	# were last accessed. Only the joined payload is kept for the next
+	# messages of the dump.
+	def _join_split_chunks(self):
+		merged = nlraw.raw_attrs()
+		for aid in self._split_pending:
+			data = ''.join(self._split_chunks[aid])
+			self._split_chunks[aid] = [ data ]
+			merged[aid] = memoryview(data)
+		self._split_pending = set()
+		self._attrs.store_raw(self, merged, merged.keys())
+
+	##
+	# Joins the collected payloads once the dump is complete and drops
+	# them as no further messages are expected.
+	def _end_split_dump(self):
+		if len(self._split_pending) > 0:
+			self._join_split_chunks()
+		self._split_chunks = {}
+
+	##
+	# Property (GET) for obtaining the attributes.
+	@property
+	def attrs(self):
+		if len(self._split_pending) > 0:
+			self._join_split_chunks()
+		return self._attrs
+
+	##
+	# Creates the nested attribute list from the raw payload. For the bands
+	# the payload may hold multiple entries for the same band, which are
+	# merged into a single wiphy_band instance.
+	def create_nested_list_raw(self, data, aid):
+		if aid != nl80211.ATTR_WIPHY_BANDS:
+			return nl80211_managed_object.create_nested_list_raw(self, data, aid)
+		(nest_class, max_nest, nest_policy) = self.nest_attr_map[aid]
+		bands = OrderedDict()
+		for band, payload in nlraw.iter_attrs(data):
+			bands.setdefault(band, []).append(payload)
+		nest_list = []
+		for band in bands.keys():
+			nattr = merge_split_attrs(bands[band], max_nest, wiphy_band.split_attrs)
+			nest_list.append(self.create_nested_obj(nest_class, nattr, nest_policy, aid))
+		return nest_list
+
+	##
+	# Refresh the wiphy dropping the attributes merged so far.
+	def refresh(self):
+		self._split_chunks = {}
+		self._split_pending = set()
+		ret = nl80211_managed_object.refresh(self)
+		if isinstance(ret, mux.request):
+			ret.add_done_callback(lambda req: self._end_split_dump())
+		else:
+			self._end_split_dump()
+		return ret
 
 	def post_store_attrs(self, attrs):
 		# cipher suites are actually C-array of u32 so using struct module
 		# to obtain the list of cipher suites.
 		if not nl80211.ATTR_CIPHER_SUITES in attrs:
 			return
+		if not nl80211.ATTR_CIPHER_SUITES in self.attrs:
+			return
 		data = self.attrs[nl80211.ATTR_CIPHER_SUITES]
 		fmt = len(data) / 4 * 'i'
 		self.attrs[nl80211.ATTR_CIPHER_SUITES] = list(struct.unpack(fmt, data))
@@ -126,6 +255,9 @@ class wiphy(nl80211_managed_object):
 	def put_obj_id(self, msg):
 		nl.nla_put_u32(msg._msg, nl80211.ATTR_WIPHY, self.phynum)
 
+	def obj_key(self):
+		return self.phynum
+
 	@property
 	def phynum(self):
 		return self._phynum
@@ -140,14 +272,295 @@ class wiphy(nl80211_managed_object):
 	def is_cmd_supported(self, cmd):
 		return cmd in self.attrs[nl80211.ATTR_SUPPORTED_COMMANDS]
 
+##
+# Generator yielding a wiphy instance for each wiphy as soon as all its
+# messages are received. The caller may stop early without the remaining
+# wiphys being decoded.
+def iter_wiphy(access=None, kind=nl.NL_CB_DEFAULT, only=None, exclude=None, split=True):
+	if access == None:
+		access = access80211(kind)
+	proj = make_projection(only, exclude, [ nl80211.ATTR_WIPHY ])
+	flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
+	m = access.alloc_genlmsg(nl80211.CMD_GET_WIPHY, flags)
+	if split:
+		nl.nla_put_flag(m._msg, nl80211.ATTR_SPLIT_WIPHY_DUMP)
+	phy = None
+	for msg in access.dump_raw(m):
+		attrs = msg.attrs
+		if not nl80211.ATTR_WIPHY in attrs:
+			continue
+		if phy != None and phy.phynum == nlraw.get_u32(attrs[nl80211.ATTR_WIPHY]):
+			phy.store_attrs(attrs)
+			continue
+		if phy != None:
+			phy._end_split_dump()
+			yield phy
+		phy = factory.get_inst().create(wiphy, access, attrs, proj)
+	if phy != None:
+		phy._end_split_dump()
+		yield phy
+
+WIPHY_CACHE_PATH = os.path.expanduser('~/.cache/py80211/wiphy')
+
+WIPHY_CACHE_MAGIC = 'PY80211W'
+WIPHY_CACHE_VERSION = 3
+
+##
+# Frequency attributes stored in the wiphy cache. The other frequency
+# attributes, eg. FREQUENCY_ATTR_DISABLED, FREQUENCY_ATTR_NO_IR or
+# FREQUENCY_ATTR_DFS_STATE, follow the regulatory domain and the DFS
+# state, which may change while the wiphy stays the same.
+WIPHY_CACHE_FREQ_ATTRS = [ nl80211.FREQUENCY_ATTR_FREQ ]
+
+_cache_hdr = struct.Struct('=8sII')
+_cache_entry = struct.Struct('=64s18sxxIII')
+
+WIPHY_SYSFS_PATH = '/sys/class/ieee80211'
+
+##
+# Returns the MAC address of the wiphy with given name as provided by
+# sysfs or an empty string if it is not available.
+def wiphy_macaddr(name):
+	try:
+		with open('%s/%s/macaddress' % (WIPHY_SYSFS_PATH, name)) as f:
+			return f.read().strip()
+	except IOError:
+		return ''
+
+##
+# Returns list of (name, MAC address, phynum) tuples for all wiphys as
+# provided by sysfs, which identify the wiphys without querying the
+# kernel over netlink. The phynum is never reused so a wiphy that is
+# registered again, eg. after reloading the driver, gets another key.
+# The list is empty when sysfs is not available.
+def wiphy_keys():
+	try:
+		names = os.listdir(WIPHY_SYSFS_PATH)
+	except OSError:
+		return []
+	keys = []
+	for name in sorted(names):
+		try:
+			with open('%s/%s/index' % (WIPHY_SYSFS_PATH, name)) as f:
+				phynum = int(f.read())
+		except (IOError, ValueError):
+			return []
+		keys.append((name, wiphy_macaddr(name), phynum))
+	return keys
+
+##
+# Generator doing a wiphy dump on a netlink socket of its own, so it
+# does not interfere with any access instance, and yielding the messages
+# as nlraw.genl_msg instances. Raises socket.error when the kernel
+# reports an error.
+def _dump_wiphy_socket(family, split):
+	payload = ''
+	if split:
+		payload = nlraw.nla_put(nl80211.ATTR_SPLIT_WIPHY_DUMP, '')
+	flags = nlraw.NLM_F_REQUEST | nlraw.NLM_F_ACK | nlraw.NLM_F_DUMP
+	sock = nlraw.open_socket()
+	try:
+		sock.send(nlraw.build_genlmsg(family, flags, 1, nl80211.CMD_GET_WIPHY, payload))
+		while True:
+			buf = nlraw.recv(sock, NL_RECV_SIZE)
+			for msg in nlraw.iter_msgs(buf):
+				if msg.seq != 1:
+					continue
+				if msg.type == nlraw.NLMSG_DONE:
+					return
+				if msg.type == nlraw.NLMSG_ERROR:
+					raise socket.error(-msg.error, 'CMD_GET_WIPHY failed')
+				if msg.type != nlraw.NLMSG_NOOP:
+					yield msg
+	finally:
+		sock.close()
+
+##
+# Returns the attribute stream in buf with the nested attributes on the
+# given path of attribute ids filtered, where None matches any id. At the
+# end of the path only the attributes with an id in keep are retained.
+def _filter_attrs(buf, path, keep):
+	out = []
+	for aid, data in nlraw.iter_attrs(buf):
+		if len(path) == 0:
+			if aid in keep:
+				out.append(nlraw.nla_put(aid, data.tobytes()))
+		elif path[0] == None or path[0] == aid:
+			out.append(nlraw.nla_put(aid, _filter_attrs(data, path[1:], keep)))
+		else:
+			out.append(nlraw.nla_put(aid, data.tobytes()))
+	return ''.join(out)
+
+##
+# Returns the wiphy message as stored in the wiphy cache, ie. with only
+# the WIPHY_CACHE_FREQ_ATTRS in the frequencies of the bands.
+def _wiphy_cache_msg(msg):
+	start = nlraw.NLMSG_HDRLEN + nlraw.GENL_HDRLEN
+	payload = _filter_attrs(msg.data[start:], [ nl80211.ATTR_WIPHY_BANDS, None,
+			       nl80211.BAND_ATTR_FREQS, None ], WIPHY_CACHE_FREQ_ATTRS)
+	return nlraw.build_genlmsg(msg.type, msg.flags, msg.seq, msg.cmd, payload, msg.version)
+
+##
+# Cache file holding the raw netlink messages of a wiphy dump. Each
+# entry is keyed by phy name, MAC address and phynum (see wiphy_keys()). The file starts
+# with a table of the entries followed by the messages so a lookup only
+# reads the table from the memory-mapped file and copies the messages of
+# the matching entry.
+class wiphy_cache(object):
+	def __init__(self, path=WIPHY_CACHE_PATH):
+		self._path = path
+		self._entries = {}
+		self._map = None
+		try:
+			f = open(path, 'rb')
+		except IOError:
+			return
+		with f:
+			try:
+				self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			except (mmap.error, ValueError):
+				# empty file can not be mapped.
+				return
+		self._parse()
+
+	def _parse(self):
+		mm = self._map
+		if len(mm) < _cache_hdr.size:
+			return
+		magic, version, count = _cache_hdr.unpack_from(mm, 0)
+		if magic != WIPHY_CACHE_MAGIC or version != WIPHY_CACHE_VERSION:
+			return
+		offset = _cache_hdr.size
+		for i in range(count):
+			if offset + _cache_entry.size > len(mm):
+				break
+			name, mac, phynum, start, size = _cache_entry.unpack_from(mm, offset)
+			offset += _cache_entry.size
+			if start + size > len(mm):
+				continue
+			key = (name.rstrip('\0'), mac.rstrip('\0'), phynum)
+			self._entries[key] = (start, size)
+
+	##
+	# Returns bytearray holding the messages of the wiphy with given name,
+	# MAC address and phynum or None if not in the cache.
+	def lookup(self, name, mac, phynum):
+		try:
+			start, size = self._entries[(name, mac, phynum)]
+		except KeyError:
+			return None
+		return bytearray(self._map[start:start + size])
+
+	##
+	# Writes the cache file replacing the current one. The entries are
+	# given as list of (name, mac, phynum, messages) tuples.
+	def save(self, entries):
+		offset = _cache_hdr.size + len(entries) * _cache_entry.size
+		table = [ _cache_hdr.pack(WIPHY_CACHE_MAGIC, WIPHY_CACHE_VERSION, len(entries)) ]
+		for name, mac, phynum, data in entries:
+			table.append(_cache_entry.pack(name, mac, phynum, offset, len(data)))
+			offset += len(data)
+		cache_dir = os.path.dirname(self._path)
+		if cache_dir != '' and not os.path.isdir(cache_dir):
+			os.makedirs(cache_dir)
+		tmp = '%s.%d' % (self._path, os.getpid())
+		with open(tmp, 'wb') as f:
+			f.write(''.join(table))
+			for name, mac, phynum, data in entries:
+				f.write(data)
+		os.rename(tmp, self._path)
+
+	def close(self):
+		if self._map != None:
+			self._map.close()
+			self._map = None
+
+##
+# Access creating the access80211 instance upon first use, eg. when a
+# wiphy is refreshed, so a wiphy_list loaded from the cache does not
+# resolve the nl80211 family nor open a socket.
+class _lazy_access(object):
+	def __init__(self, kind):
+		self._kind = kind
+		self._access = None
+
+	def __getattr__(self, name):
+		if self._access == None:
+			self._access = access80211(self._kind)
+		return getattr(self._access, name)
+
+##
+# List of all wiphys. By default a split dump is requested so the kernel
+# can provide all wiphy data, which is merged per wiphy.
+#
+# When a cache path is given, eg. WIPHY_CACHE_PATH, the wiphys are created
+# from the messages in the cache file if name, MAC address and phynum of
+# all wiphys in sysfs match. Otherwise the wiphys are dumped on a socket
+# of its own and the cache file is rewritten. In both cases the frequencies
+# only hold the WIPHY_CACHE_FREQ_ATTRS so the wiphys are the same whether
+# the cache is used or not. The regulatory attributes are obtained with
+# wiphy.refresh().
 class wiphy_list(custom_handler):
-	def __init__(self, kind=nl.NL_CB_DEFAULT):
+	def __init__(self, kind=nl.NL_CB_DEFAULT, access=None, only=None, exclude=None, split=True, cache=None):
 		self._wiphy = {}
-		a = access80211(kind)
+		self._proj = make_projection(only, exclude, [ nl80211.ATTR_WIPHY ])
+		if access == None and cache != None:
+			a = _lazy_access(kind)
+		elif access == None:
+			a = access80211(kind)
+		else:
+			a = access
+		self._access = a
+		if cache != None:
+			self._load_cached(split, cache)
+			self._end_dump()
+			return
 		flags = nlc.NLM_F_REQUEST | nlc.NLM_F_ACK | nlc.NLM_F_DUMP
 		m = a.alloc_genlmsg(nl80211.CMD_GET_WIPHY, flags)
-		self._access = a
-		a.send(m, self)
+		if split:
+			nl.nla_put_flag(m._msg, nl80211.ATTR_SPLIT_WIPHY_DUMP)
+		ret = a.send(m, self)
+		if isinstance(ret, mux.request):
+			ret.add_done_callback(lambda req: self._end_dump())
+		else:
+			self._end_dump()
+
+	def _end_dump(self):
+		for phy in self._wiphy.values():
+			phy._end_split_dump()
+
+	def _load_cached(self, split, path):
+		cache = wiphy_cache(path)
+		keys = wiphy_keys()
+		cached = [ cache.lookup(*key) for key in keys ]
+		cache.close()
+		if len(keys) > 0 and not None in cached:
+			for data in cached:
+				for msg in nlraw.iter_msgs(data):
+					self.handle_raw(msg)
+			return
+		entries = OrderedDict()
+		try:
+			for dumped in _dump_wiphy_socket(self._access.family, split):
+				data = _wiphy_cache_msg(dumped)
+				msg = next(nlraw.iter_msgs(bytearray(data)))
+				self.handle_raw(msg)
+				attrs = msg.attrs
+				if not nl80211.ATTR_WIPHY in attrs:
+					continue
+				phynum = nlraw.get_u32(attrs[nl80211.ATTR_WIPHY])
+				if not phynum in entries:
+					name = nlraw.get_string(attrs[nl80211.ATTR_WIPHY_NAME])
+					entries[phynum] = [ name, wiphy_macaddr(name), phynum, [] ]
+				entries[phynum][3].append(data)
+		except socket.error as e:
+			# dump failed so do not store partial result.
+			print 'wiphy dump failed: %s' % e
+			return
+		try:
+			cache.save([ (name, mac, phynum, ''.join(msgs)) for name, mac, phynum, msgs in entries.values() ])
+		except (IOError, OSError) as e:
+			print 'failed to write wiphy cache: %s' % e
 
 	def __iter__(self):
 		return iter(self._wiphy.values())
@@ -160,7 +573,7 @@ class wiphy_list(custom_handler):
 				if phynum in self._wiphy.keys():
 					self._wiphy[phynum].store_attrs(attrs)
 				else:
-					phy = factory.get_inst().create(wiphy, self._access, attrs)
+					phy = factory.get_inst().create(wiphy, self._access, attrs, self._proj)
 					self._wiphy[phy.phynum] = phy
 			return nl.NL_SKIP
 		except Exception as e:
@@ -168,6 +581,21 @@ class wiphy_list(custom_handler):
 			print v.message
 			traceback.print_tb(tb)
 
+	def handle_raw(self, msg):
+		try:
+			attrs = msg.attrs
+			if nl80211.ATTR_WIPHY in attrs:
+				phynum = nlraw.get_u32(attrs[nl80211.ATTR_WIPHY])
+				if phynum in self._wiphy.keys():
+					self._wiphy[phynum].store_attrs(attrs)
+				else:
+					phy = factory.get_inst().create(wiphy, self._access, attrs, self._proj)
+					self._wiphy[phy.phynum] = phy
+		except Exception as e:
+			(t,v,tb) = sys.exc_info()
+			print v.message
+			traceback.print_tb(tb)
+
 	@property
 	def wiphys(self):
 		return self._wiphy.values()